@@ -3,9 +3,35 @@
 __version__ = '2024.03.10a'
 
 import sqlite3
-import json
 import argparse
 import os
+import sys
+import collections
+import multiprocessing
+
+try:
+    import orjson
+
+    def dump_json(data):
+        """Serialize data to compact UTF-8 encoded JSON using orjson."""
+        return orjson.dumps(data)
+except ImportError:
+    import json
+
+    def dump_json(data):
+        """Serialize data to compact UTF-8 encoded JSON, used when orjson is not installed."""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+# Number of rows fetched from SQLite at once
+FETCH_BATCH_SIZE = 10000
+# Size of the write buffer used for the output file or stdout
+WRITE_BUFFER_SIZE = 1 << 20
+# Number of records collected in memory before they are written out
+WRITE_BATCH_SIZE = 1000
+# Encodings tried in order by `decode_with_fallback` when a name is not valid UTF-8
+FALLBACK_ENCODINGS = ('shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')
+# PRAGMAs applied to the read-only SQLite connection, the database is only read once from start to end
+READ_PRAGMAS = ('query_only=1', 'cache_size=-200000', 'temp_store=MEMORY', 'mmap_size=30000000000')
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='magnetico2bitmagnet processes a magnetico SQLite database to extract and print data in a bitmagnet supported JSON format.', formatter_class=argparse.RawTextHelpFormatter)
@@ -13,11 +39,19 @@ def parse_arguments():
     parser.add_argument('-o', '--output', '--to-file', help='Exports the JSON output to a file specified by this argument.')
     parser.add_argument('-s', '--split-size', type=int, help='Splits the output into multiple files after a specified number of records. Requires `--output` to be set.')
     parser.add_argument('--auto-create-dir', action='store_true', help='Automatically create the output directory if it does not exist, without prompting.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to encode the records to JSON, default is 1.')
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}', help="Show the script's version.")
     return parser.parse_args()
 
-def decode_with_fallback(byte_sequence, encodings=('utf-8', 'shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')):
+def decode_with_fallback(byte_sequence, encodings=FALLBACK_ENCODINGS):
     """Attempt to decode a byte sequence using a list of encodings, falling back to a lossy decoding if necessary."""
+    # Most names are plain ASCII or valid UTF-8, handle those before trying the other encodings
+    if byte_sequence.isascii():
+        return byte_sequence.decode('ascii')
+    try:
+        return byte_sequence.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
     for encoding in encodings:
         try:
             return byte_sequence.decode(encoding)
@@ -45,10 +79,23 @@ def is_valid_sqlite3_file(filepath):
     """Check if the file at filepath is a valid SQLite3 database file."""
     if not os.path.isfile(filepath):
         return False
-    with open(filepath, 'rb') as f:
-        header = f.read(16)
+    # Read the header with a raw file descriptor, a buffered file object is not needed for 16 bytes
+    fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        header = os.read(fd, 16)
+    finally:
+        os.close(fd)
     return header == b'SQLite format 3\000'
 
+def apply_read_pragmas(conn):
+    """Tune the read-only SQLite connection for a single bulk read of the database."""
+    for pragma in READ_PRAGMAS:
+        try:
+            conn.execute(f"PRAGMA {pragma}")
+        except sqlite3.Error:
+            # Older SQLite builds may not support every PRAGMA, these are optimizations only
+            continue
+
 def check_database_structure(conn):
     required_columns = {"info_hash", "name", "total_size", "discovered_on"}
     cursor = conn.cursor()
@@ -58,22 +105,67 @@ def check_database_structure(conn):
     
     cursor.execute("PRAGMA table_info(torrents)")
     columns = {row[1] for row in cursor.fetchall()}
+    cursor.close()
     missing_columns = required_columns - columns
     if missing_columns:
         return False, f"Missing required columns: {', '.join(missing_columns)}"
 
     return True, ""
 
-def generate_output_file_path(base_path, counter, split_size):
-    if counter == 0:
-        return base_path
-    else:
-        base_directory, original_filename = os.path.split(base_path)
-        filename, ext = os.path.splitext(original_filename)
-        new_filename = f"{filename}-{counter * split_size + 1}{ext}"
-        return os.path.join(base_directory, new_filename)
+def output_file_path_generator(base_path, split_size):
+    """Returns a function that generates the output file path for a file counter, the base path is only split once."""
+    base_directory, original_filename = os.path.split(base_path)
+    filename, ext = os.path.splitext(original_filename)
+
+    def generate_output_file_path(counter):
+        if counter == 0:
+            return base_path
+        return os.path.join(base_directory, f"{filename}-{counter * split_size + 1}{ext}")
+
+    return generate_output_file_path
+
+def fetch_batches(cursor):
+    """Yields the rows of an executed query in batches instead of loading the whole table into memory."""
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+def encode_rows(rows):
+    """Encodes a batch of magnetico rows to JSON lines, runs in a worker process when `--jobs` is larger than 1."""
+    # The same dict is reused for every record, only the values change
+    data = {
+        "infoHash": None,
+        "name": None,
+        "size": None,
+        "publishedAt": None,
+        "source": "magnetico"
+    }
+    lines = []
+    for row in rows:
+        try:
+            data["infoHash"] = row[0].hex()
+            data["name"] = decode_with_fallback(row[1])
+            data["size"] = row[2]
+            data["publishedAt"] = row[3].decode('utf-8')
+            lines.append(dump_json(data) + b'\n')
+        except Exception as e:
+            print(f"An error occurred: ", e, file=sys.stderr)
+            print(f"Problematic data: {row}", file=sys.stderr)
+    return lines
+
+def encode_batches_in_pool(pool, batches, jobs):
+    """Encodes batches in the worker pool, yielding the results in order with a limited number of batches in flight."""
+    in_flight = collections.deque()
+    for rows in batches:
+        in_flight.append(pool.apply_async(encode_rows, (rows,)))
+        if len(in_flight) > jobs * 2:
+            yield in_flight.popleft().get()
+    while in_flight:
+        yield in_flight.popleft().get()
 
-def main(database_path, output_file, split_size):
+def main(database_path, output_file, split_size, auto_create_dir, jobs):
     """Check if the database path exists, is readable, and is a valid SQLite3 file"""
 
     if not os.path.exists(database_path):
@@ -86,66 +178,83 @@ def main(database_path, output_file, split_size):
         print(f"Error: The file '{database_path}' is not a valid SQLite3 database.")
         exit(1)
 
-    # Connect to the SQLite database
-    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
-    valid_structure, error_message = check_database_structure(conn)
-    if not valid_structure:
-        print(f"Error: {error_message}")
-        conn.close()
-        exit(1)
+    # All split files are written to the same directory, so it only has to be checked once
+    if output_file:
+        ensure_directory_exists(output_file, auto_create_dir)
 
-    # Set text factory to bytes since decoding is handeled by `decode_with_fallback`
-    conn.text_factory = bytes
-    c = conn.cursor()
+    f = None
+    out = None
+    conn = None
+    file_counter = 0
+    # Records left before the next output file is opened, -1 never reaches 0 so the output is not split
+    records_left = 0
 
-    # Execute the SQL query
-    c.execute("SELECT hex(info_hash), name, total_size, strftime('%Y-%m-%dT%H:%M:%S.000Z', discovered_on, 'unixepoch') FROM torrents")
+    # The worker processes are started before connecting, so they do not inherit the SQLite connection
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        # Connect to the SQLite database, the same connection is used for validation and reading
+        conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+        apply_read_pragmas(conn)
+        valid_structure, error_message = check_database_structure(conn)
+        if not valid_structure:
+            print(f"Error: {error_message}")
+            exit(1)
 
-    # Fetch all rows from the query
-    rows = c.fetchall()
+        # Set text factory to bytes since decoding is handeled by `decode_with_fallback`
+        conn.text_factory = bytes
+        c = conn.cursor()
 
-    # Close the connection
-    conn.close()
+        # Execute the SQL query
+        c.execute("SELECT info_hash, name, total_size, strftime('%Y-%m-%dT%H:%M:%S.000Z', discovered_on, 'unixepoch') FROM torrents")
 
-    f = None
-    current_record = 0
-    file_counter = 0
+        if output_file:
+            generate_output_file_path = output_file_path_generator(output_file, split_size)
 
-    for row in rows:
-        if output_file and (current_record % split_size == 0):
-            ensure_directory_exists(output_file, args.auto_create_dir)
-            if f:
-                f.close()
-            new_output_file = generate_output_file_path(output_file, file_counter, split_size)
-            f = open(new_output_file, 'w', encoding='utf-8', newline='\n')
-            file_counter += 1
+        # Records are collected in `pending` and written in batches to a large buffered writer
+        pending = bytearray()
+        pending_records = 0
+        if not output_file:
+            sys.stdout.flush()
+            out = open(sys.stdout.fileno(), 'wb', buffering=WRITE_BUFFER_SIZE, closefd=False)
 
-        try:
-            info_hash = row[0].decode('utf-8')
-            name = decode_with_fallback(row[1])
-            published_at = row[3].decode('utf-8')
-
-            data = {
-                "infoHash": info_hash,
-                "name": name,
-                "size": row[2],
-                "publishedAt": published_at,
-                "source": "magnetico"
-            }
-            json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-
-            if output_file:
-                f.write(json_data + '\n')
-            else:
-                print(json_data)
-            current_record += 1
+        # Batches are encoded in order, by worker processes if requested, and written sequentially here
+        if pool:
+            encoded_batches = encode_batches_in_pool(pool, fetch_batches(c), jobs)
+        else:
+            encoded_batches = map(encode_rows, fetch_batches(c))
 
-        except Exception as e:
-            print(f"An error occurred: ", e)
-            print(f"Problematic data: {row}")
+        for lines in encoded_batches:
+            for line in lines:
+                if output_file and records_left == 0:
+                    if f:
+                        f.write(pending)
+                        pending.clear()
+                        pending_records = 0
+                        f.close()
+                    new_output_file = generate_output_file_path(file_counter)
+                    f = out = open(new_output_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+                    file_counter += 1
+                    records_left = split_size or -1
+
+                pending += line
+                pending_records += 1
+                records_left -= 1
 
-    if f:
-        f.close()
+                if pending_records >= WRITE_BATCH_SIZE:
+                    out.write(pending)
+                    pending.clear()
+                    pending_records = 0
+
+        if out and pending:
+            out.write(pending)
+    finally:
+        if pool:
+            pool.terminate()
+        # Close the connection
+        if conn:
+            conn.close()
+        if out:
+            out.close()
 
 if __name__ == '__main__':
     args = parse_arguments()
@@ -158,4 +267,8 @@ if __name__ == '__main__':
         print(f"split-size must be a positive integer. '{args.split_size}' is invalid.")
         exit(1)
 
-    main(args.database_path, args.output, args.split_size)
\ No newline at end of file
+    if args.jobs <= 0:
+        print(f"jobs must be a positive integer. '{args.jobs}' is invalid.")
+        exit(1)
+
+    main(args.database_path, args.output, args.split_size, args.auto_create_dir, args.jobs)
\ No newline at end of file
@@ -3,13 +3,94 @@
 __version__ = '2024.04.23b'
 
 import argparse
+import collections
+import io
+import itertools
+import multiprocessing
+import operator
 import os
 import sqlite3
+import struct
 import psycopg2
-from datetime import datetime, timezone
-from psycopg2 import sql
+from datetime import datetime, timedelta, timezone
 from tqdm import tqdm
 
+# Columns of the torrents table filled by this script
+TORRENT_COLUMNS = ('info_hash', 'name', 'size', 'private', 'created_at', 'updated_at', 'files_status', 'files_count')
+# Columns of the torrent_files table filled by this script
+TORRENT_FILE_COLUMNS = ('info_hash', 'index', 'path', 'size', 'created_at', 'updated_at')
+# Columns of the torrents_torrent_sources table filled by this script
+TORRENT_SOURCE_COLUMNS = ('source', 'info_hash', 'published_at', 'created_at', 'updated_at')
+# Columns of the torrent_contents staging table, `tsv` is computed from the info hash when the rows are merged
+TORRENT_CONTENT_COLUMNS = ('info_hash', 'languages', 'created_at', 'updated_at')
+# Statements prepared once per session by `prepare_statements`, the staging merges run for every batch
+# and the single row INSERT statements are used when a batch has to be retried row by row
+PREPARE_STATEMENTS = (
+    "PREPARE merge_torrents AS "
+    f"INSERT INTO torrents ({', '.join(TORRENT_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_COLUMNS)} FROM torrents_staging ON CONFLICT (info_hash) DO NOTHING",
+    "PREPARE merge_torrent_files AS "
+    f"INSERT INTO torrent_files ({', '.join(TORRENT_FILE_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_FILE_COLUMNS)} FROM torrent_files_staging ON CONFLICT (info_hash, path) DO NOTHING",
+    "PREPARE merge_torrent_sources AS "
+    f"INSERT INTO torrents_torrent_sources ({', '.join(TORRENT_SOURCE_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_SOURCE_COLUMNS)} FROM torrents_torrent_sources_staging ON CONFLICT (source, info_hash) DO NOTHING",
+    "PREPARE merge_torrent_contents AS "
+    f"INSERT INTO torrent_contents ({', '.join(TORRENT_CONTENT_COLUMNS)}, tsv) "
+    f"SELECT {', '.join(TORRENT_CONTENT_COLUMNS)}, to_tsvector(encode(info_hash, 'hex')) "
+    "FROM torrent_contents_staging ON CONFLICT DO NOTHING",
+    "PREPARE insert_torrent AS "
+    "INSERT INTO torrents (info_hash, name, size, private, created_at, updated_at, files_status, files_count) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8) ON CONFLICT (info_hash) DO NOTHING",
+    "PREPARE insert_torrent_file AS "
+    "INSERT INTO torrent_files (info_hash, index, path, size, created_at, updated_at) "
+    "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (info_hash, path) DO NOTHING",
+    "PREPARE insert_torrent_source AS "
+    "INSERT INTO torrents_torrent_sources (source, info_hash, published_at, created_at, updated_at) "
+    "VALUES ($1, $2, $3, $4, $5) ON CONFLICT (source, info_hash) DO NOTHING",
+    "PREPARE insert_torrent_content AS "
+    "INSERT INTO torrent_contents (info_hash, languages, created_at, updated_at, tsv) "
+    "VALUES ($1, $2, $3, $4, to_tsvector($5)) ON CONFLICT DO NOTHING",
+)
+EXECUTE_MERGE_TORRENTS = "EXECUTE merge_torrents"
+EXECUTE_MERGE_TORRENT_FILES = "EXECUTE merge_torrent_files"
+EXECUTE_MERGE_TORRENT_SOURCES = "EXECUTE merge_torrent_sources"
+EXECUTE_MERGE_TORRENT_CONTENTS = "EXECUTE merge_torrent_contents"
+EXECUTE_INSERT_TORRENT = "EXECUTE insert_torrent (%s, %s, %s, %s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_FILE = "EXECUTE insert_torrent_file (%s, %s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_SOURCE = "EXECUTE insert_torrent_source (%s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_CONTENT = "EXECUTE insert_torrent_content (%s, %s, %s, %s, %s)"
+SELECT_SOURCE_SQL = "SELECT 1 FROM torrent_sources WHERE key = %s"
+INSERT_SOURCE_SQL = "INSERT INTO torrent_sources (key, name, created_at, updated_at) VALUES (%s, %s, %s, %s)"
+# Files are joined in `torrent_id` order and grouped per torrent in Python, so both tables are read in a single pass
+SELECT_TORRENTS_WITH_FILES_SQL = """
+SELECT t.id, t.info_hash, t.name, t.total_size, t.discovered_on, f.size, f.path
+FROM torrents t
+LEFT JOIN files f ON f.torrent_id = t.id
+ORDER BY t.id, f.id
+"""
+SELECT_TORRENTS_SQL = """
+SELECT id, info_hash, name, total_size, discovered_on
+FROM torrents
+ORDER BY id
+"""
+# Characters that have to be escaped in PostgreSQL's COPY text format
+COPY_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+# Signature, flags and header extension length that start PostgreSQL's binary COPY format, and the trailer that ends it
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00\x00\x00\x00' + b'\x00\x00\x00\x00'
+COPY_BINARY_TRAILER = b'\xff\xff'
+# Big-endian integers used for the field counts, field lengths and values of the binary COPY format
+COPY_INT16 = struct.Struct('>h')
+COPY_INT32 = struct.Struct('>i')
+COPY_INT64 = struct.Struct('>q')
+# Timestamps in the binary COPY format are microseconds since 2000-01-01 UTC
+POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+# Encodings tried in order by `decode_with_fallback` when a name is not valid UTF-8
+FALLBACK_ENCODINGS = ('shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')
+# PRAGMAs applied to the read-only SQLite connection, the database is only read once from start to end
+READ_PRAGMAS = ('query_only=1', 'cache_size=-200000', 'temp_store=MEMORY', 'mmap_size=30000000000')
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='magnetico2database processes a magnetico SQLite database to extract and print data in a bitmagnet supported JSON format.', formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("database_path", nargs='?', help="The path to the directory containing .torrent files.\nIf not provided, the script will prompt for it.")
@@ -24,11 +105,19 @@ def parse_arguments():
     parser.add_argument('--import-padding', action='store_true', help='Handle padding files as normal files (not recommended).')
     parser.add_argument('--insert-torrent-content', "--insert-content", action='store_true', help='Insert data into the "torrent_content" column to make hashes directly searchable (not recommended).')
     parser.add_argument('--force-import', action='store_true', help='Force importing torrents with no name and filenames (not recommended).')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to convert the records, default is 1.')
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}', help="Show the script's version and exit")
     return parser.parse_args()
 
-def decode_with_fallback(byte_sequence, encodings=('utf-8', 'shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')):
+def decode_with_fallback(byte_sequence, encodings=FALLBACK_ENCODINGS):
     """Attempt to decode a byte sequence using a list of encodings, falling back to a lossy decoding if necessary."""
+    # Most names are plain ASCII or valid UTF-8, handle those before trying the other encodings
+    if byte_sequence.isascii():
+        return byte_sequence.decode('ascii')
+    try:
+        return byte_sequence.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
     for encoding in encodings:
         try:
             return byte_sequence.decode(encoding)
@@ -37,76 +126,178 @@ def decode_with_fallback(byte_sequence, encodings=('utf-8', 'shift_jis', 'euc_jp
     # If all decodings fail, fall back to a lossy decoding using 'utf-8' with replacement characters for undecodable bytes
     return byte_sequence.decode('utf-8', errors='replace')
 
-def insert_torrent_content(pg_conn, info_hash, creation_date):
-    info_hash_hex = info_hash.hex()
-    tsvector_placeholder = f"'{info_hash_hex}'"
-    
-    sql_command = ("INSERT INTO torrent_contents (info_hash, languages, created_at, updated_at, tsv) "
-                   "VALUES (%s, %s, %s, %s, to_tsvector({tsvector_placeholder})) ON CONFLICT DO NOTHING")
-    
-    values = (info_hash, '[]', creation_date, creation_date)
-    cur = pg_conn.cursor()
+def prepare_statements(cur):
+    """Prepare the statements once per session, the staging tables have to exist before the merges can be prepared."""
+    for statement in PREPARE_STATEMENTS:
+        cur.execute(statement)
+    cur.connection.commit()
+
+def insert_torrent_content(cur, info_hash, creation_date):
+    values = (info_hash, '[]', creation_date, creation_date, info_hash.hex())
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command.format(tsvector_placeholder=tsvector_placeholder)), values)
-        pg_conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT_CONTENT, values)
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        pg_conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         tqdm.write(f"Error inserting torrent content into the database: {e}")
         tqdm.write(f"Torrent source of the error: {info_hash.hex()}\n")
-    finally:
-        cur.close()
 
-def insert_torrent_source(pg_conn, source, info_hash, creation_date):
-    sql_command = ("INSERT INTO torrents_torrent_sources (source, info_hash, published_at, created_at, updated_at) "
-                   "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (source, info_hash) DO NOTHING")
+def insert_torrent_source(cur, source, info_hash, creation_date):
     values = (source, info_hash, creation_date, creation_date, creation_date)
-    cur = pg_conn.cursor()
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command), values)
-        pg_conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT_SOURCE, values)
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        pg_conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         tqdm.write(f"Error inserting torrent source into the database: {e}")
         tqdm.write(f"Torrent source of the error: {info_hash.hex()}\n")
-    finally:
-        cur.close()
 
-def insert_torrent_files(pg_conn, info_hash, files_info):
-    sql_command = ("INSERT INTO torrent_files (info_hash, index, path, size, created_at, updated_at) "
-                   "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (info_hash, path) DO NOTHING")
-    cur = pg_conn.cursor()
+def insert_torrent_files(cur, info_hash, files_info):
+    now = datetime.now(timezone.utc)
+    cur.execute("SAVEPOINT insert_row")
     try:
         for file_info in files_info:
-            cur.execute(sql.SQL(sql_command), (info_hash,) + file_info + (datetime.now(timezone.utc), datetime.now(timezone.utc)))
-        pg_conn.commit()
+            cur.execute(EXECUTE_INSERT_TORRENT_FILE, (info_hash,) + file_info + (now, now))
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        pg_conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         tqdm.write(f"[ERROR]|[FILE]: Unknown error: {e}")
-    finally:
-        cur.close()
 
-def insert_torrent(pg_conn, torrent_details):
-    sql_command = ("INSERT INTO torrents (info_hash, name, size, private, created_at, updated_at, files_status, files_count) "
-                   "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (info_hash) DO NOTHING")
-    cur = pg_conn.cursor()
+def insert_torrent(cur, torrent_details):
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command), torrent_details)
-        pg_conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT, torrent_details)
+        cur.execute("RELEASE SAVEPOINT insert_row")
         return True
     except Exception as e:
-        pg_conn.rollback()
-        tqdm.write(e)
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
+        tqdm.write(f"{e}")
         return False
-    finally:
-        cur.close()
+
+def insert_torrent_details(cur, source_name, add_files, insert_content, torrent_details):
+    """Insert a single torrent and its related rows, every statement runs in its own savepoint so a failing row does not
+    abort the transaction. The caller commits."""
+    insert_torrent_succeeded = insert_torrent(cur, torrent_details[:-1])
+    if not insert_torrent_succeeded:
+        return
+    if add_files and torrent_details[-1] and torrent_details[6] != "single":
+        insert_torrent_files(cur, torrent_details[0], torrent_details[-1])
+    insert_torrent_source(cur, source_name, torrent_details[0], torrent_details[4])
+    if insert_content:
+        insert_torrent_content(cur, torrent_details[0], torrent_details[4])
+
+def copy_text_value(value):
+    """Format a value for PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    if isinstance(value, str):
+        return value.translate(COPY_TEXT_ESCAPES)
+    return str(value)
+
+def copy_rows(cur, table_name, columns, rows):
+    """Stream rows into a table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join([copy_text_value(value) for value in row]))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+def copy_binary_value(value):
+    """Format a value for PostgreSQL's binary COPY format, integers are always sent as bigint."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, bool):
+        return b'\x01' if value else b'\x00'
+    if isinstance(value, int):
+        return COPY_INT64.pack(value)
+    if isinstance(value, datetime):
+        return COPY_INT64.pack((value - POSTGRES_EPOCH) // MICROSECOND)
+    raise TypeError(f"Unsupported type for binary COPY: {type(value).__name__}")
+
+def copy_binary_rows(cur, table_name, columns, rows):
+    """Stream rows into a table with COPY FROM STDIN in PostgreSQL's binary format."""
+    buffer = bytearray(COPY_BINARY_HEADER)
+    field_count = COPY_INT16.pack(len(columns))
+    null_field = COPY_INT32.pack(-1)
+    for row in rows:
+        buffer += field_count
+        for value in row:
+            if value is None:
+                buffer += null_field
+                continue
+            data = copy_binary_value(value)
+            buffer += COPY_INT32.pack(len(data))
+            buffer += data
+    buffer += COPY_BINARY_TRAILER
+    cur.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)", io.BytesIO(buffer))
+
+def create_staging_tables(cur):
+    """Create the session-local staging tables used to COPY batches before merging them into the bitmagnet tables."""
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrents_staging (LIKE torrents INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrent_files_staging "
+                "(info_hash bytea, index bigint, path text, size bigint, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrents_torrent_sources_staging "
+                "(source text, info_hash bytea, published_at timestamptz, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrent_contents_staging "
+                "(info_hash bytea, languages jsonb, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.connection.commit()
+
+def insert_batch(cur, source_name, add_files, insert_content, batch):
+    """Insert a batch of torrents and their related rows with one statement per table and a single commit.
+    If the batch fails, the torrents are inserted one by one to find and report the problematic ones."""
+    if not batch:
+        return
+    now = datetime.now(timezone.utc)
+    torrents = []
+    files = []
+    sources = []
+    contents = []
+    for torrent_details in batch:
+        info_hash = torrent_details[0]
+        creation_date = torrent_details[4]
+        torrents.append(torrent_details[:-1])
+        if add_files and torrent_details[-1] and torrent_details[6] != "single":
+            files.extend((info_hash,) + file_info + (now, now) for file_info in torrent_details[-1])
+        sources.append((source_name, info_hash, creation_date, creation_date, creation_date))
+        if insert_content:
+            contents.append((info_hash, '[]', creation_date, creation_date))
+
+    try:
+        # COPY has no ON CONFLICT, so torrents are copied into the staging table and merged from there
+        copy_rows(cur, "torrents_staging", TORRENT_COLUMNS, torrents)
+        cur.execute(EXECUTE_MERGE_TORRENTS)
+        if files:
+            copy_binary_rows(cur, "torrent_files_staging", TORRENT_FILE_COLUMNS, files)
+            cur.execute(EXECUTE_MERGE_TORRENT_FILES)
+        copy_binary_rows(cur, "torrents_torrent_sources_staging", TORRENT_SOURCE_COLUMNS, sources)
+        cur.execute(EXECUTE_MERGE_TORRENT_SOURCES)
+        if contents:
+            copy_rows(cur, "torrent_contents_staging", TORRENT_CONTENT_COLUMNS, contents)
+            cur.execute(EXECUTE_MERGE_TORRENT_CONTENTS)
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        tqdm.write(f"[ERROR]|[BATCH]: Inserting a batch of {len(batch)} torrents failed, retrying them one by one: {e}")
+        for torrent_details in batch:
+            insert_torrent_details(cur, source_name, add_files, insert_content, torrent_details)
+        cur.connection.commit()
 
 def get_torrent_details(magnetico_torrent_data, add_files, add_files_limit, files, import_padding):
     try:
-        info_hash_lower = (magnetico_torrent_data[1].decode('utf-8')).lower()
-        info_hash = bytes.fromhex(info_hash_lower)
+        info_hash = magnetico_torrent_data[1]
         name = name = decode_with_fallback(magnetico_torrent_data[2])
         total_size = magnetico_torrent_data[3]
-        creation_date = magnetico_torrent_data[4].decode('utf-8')
+        # Converted once here, the same datetime is used for the torrent, its source and its content
+        creation_date = datetime.fromtimestamp(magnetico_torrent_data[4], tz=timezone.utc)
         file_status = 'multi'
         files_count = len(files)
         if files_count == 1:
@@ -114,17 +305,17 @@ def get_torrent_details(magnetico_torrent_data, add_files, add_files_limit, file
             file_status = 'single'
         files_info = []
         if file_status == "multi":
-            file_index = 0
-            for file in files:
-                file_path = decode_with_fallback(file[1])
-                file_size = file[0]
-
-                if import_padding or ("_____padding" not in file_path and ".____padding" not in file_path) and file_index < add_files_limit:
-                    files_info.append((file_index, file_path, file_size))
-                file_index += 1
-                if file_index > add_files_limit:
-                    file_status = 'over_threshold'
-                    break
+            if files_count > add_files_limit:
+                file_status = 'over_threshold'
+            # Only the files within the limit are looked at, the padding check is left out of the loop when padding is imported
+            # and padding files are detected on the raw bytes, so they are never decoded when they are skipped
+            if import_padding:
+                files_info = [(file_index, decode_with_fallback(raw_file_path), size)
+                              for file_index, (size, raw_file_path) in enumerate(files[:add_files_limit])]
+            else:
+                files_info = [(file_index, decode_with_fallback(raw_file_path), size)
+                              for file_index, (size, raw_file_path) in enumerate(files[:add_files_limit])
+                              if b"_____padding" not in raw_file_path and b".____padding" not in raw_file_path]
         else:
             if add_files:
                 files_info.append((0, name, total_size))
@@ -132,57 +323,91 @@ def get_torrent_details(magnetico_torrent_data, add_files, add_files_limit, file
         tqdm.write(f"{e}")
     return (info_hash, name, total_size, False, creation_date, creation_date, file_status, files_count, files_info)
 
-def process_magnetico_database(database_path, sqlite_conn, pg_conn, source_name, add_files, add_files_limit, insert_content, import_padding, force_import, batch_size=1000):
+def read_torrent_batches(torrents_cursor, add_files, force_import, batch_size):
+    """Yields batches of torrents and their files from the SQLite query, together with the number of records read for them."""
+    batch = []
+    records = 0
+    for _, rows in itertools.groupby(torrents_cursor, key=operator.itemgetter(0)):
+        rows = list(rows)
+        torrent = rows[0]
+        files = []
+        records += 1
+
+        if add_files:
+            # A torrent without files has a single row with NULL file columns
+            files = [row[5:] for row in rows if row[6] is not None]
+            all_empty = all(second == b'' for _, second in files)
+            if all_empty:
+                if force_import:
+                    tqdm.write(f"[INFO]|[DATA]: Record with id {torrent[0]} only contains empty filenames, force importing.")
+                if not force_import:
+                    tqdm.write(f"[INFO]|[DATA]: Record with id {torrent[0]} only contains empty filenames, skipping.")
+                    continue
+        batch.append((torrent, files))
+        if len(batch) >= batch_size:
+            yield records, batch
+            batch = []
+            records = 0
+    if records:
+        yield records, batch
+
+def get_batch_details(batch, add_files, add_files_limit, import_padding):
+    """Get the torrent details of a batch, runs in a worker process when `--jobs` is larger than 1."""
+    return [get_torrent_details(torrent, add_files, add_files_limit, files, import_padding) for torrent, files in batch]
+
+def get_batches_details_in_pool(pool, torrent_batches, jobs, add_files, add_files_limit, import_padding):
+    """Gets the details of batches in the worker pool, yielding the results in order with a limited number of batches in flight."""
+    in_flight = collections.deque()
+    for records, batch in torrent_batches:
+        in_flight.append((records, pool.apply_async(get_batch_details, (batch, add_files, add_files_limit, import_padding))))
+        if len(in_flight) > jobs * 2:
+            records, result = in_flight.popleft()
+            yield records, result.get()
+    while in_flight:
+        records, result = in_flight.popleft()
+        yield records, result.get()
+
+def process_magnetico_database(database_path, sqlite_conn, pg_conn, source_name, add_files, add_files_limit, insert_content, import_padding, force_import, pool, jobs, batch_size=1000):
     sqlite_conn.text_factory = bytes
     tqdm.write("[INFO]|[SQLite]: Getting amount of records...")
     total_count = sqlite_conn.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
     tqdm.write(f"[INFO]|[SQLite]: Found {total_count} records in the database.")
 
-    with tqdm(total=total_count, desc="Processing magnetico records") as pbar:
-        offset = 0
-        while offset < total_count:
-            torrents_query = f"""
-            SELECT id, hex(info_hash), name, total_size, strftime('%Y-%m-%dT%H:%M:%S.000Z', discovered_on, 'unixepoch')
-            FROM torrents
-            LIMIT {batch_size} OFFSET {offset}
-            """
-            for torrent in sqlite_conn.execute(torrents_query):
-                try:
-                    files = []
-                    files_count = 1
-                    
-                    if add_files:
-                        files_cursor = sqlite_conn.cursor()
-                        files_cursor.execute(f"SELECT size, path FROM files WHERE torrent_id = {torrent[0]}")
-                        files = files_cursor.fetchall()
-                        all_empty = all(second == b'' for _, second in files)
-                        if all_empty:
-                            if force_import:
-                                tqdm.write(f"[INFO]|[DATA]: Record with id {torrent[0]} only contains empty filenames, force importing.")
-                            if not force_import:
-                                tqdm.write(f"[INFO]|[DATA]: Record with id {torrent[0]} only contains empty filenames, skipping.")
-                                continue
-                        files_count = len(files)
-                        files_cursor.close()
-                    torrent_details = get_torrent_details(torrent, add_files, add_files_limit, files, import_padding)
-                    if torrent_details:
-                        insert_torrent_succeeded = insert_torrent(pg_conn, torrent_details[:-1])
-                        if not insert_torrent_succeeded:
-                            continue
-                        if add_files and torrent_details[-1] and torrent_details[6] != "single":
-                            insert_torrent_files(pg_conn, torrent_details[0], torrent_details[-1])
-                        insert_torrent_source(pg_conn, source_name, torrent_details[0], torrent_details[4])
-                        if insert_content:
-                            insert_torrent_content(pg_conn, torrent_details[0], torrent_details[4])
-                finally:
-                    pbar.update(1)
-            offset += batch_size
+    if add_files:
+        torrents_query = SELECT_TORRENTS_WITH_FILES_SQL
+    else:
+        torrents_query = SELECT_TORRENTS_SQL
+    # A single PostgreSQL cursor is used for all inserts
+    pg_cursor = pg_conn.cursor()
+    torrents_cursor = None
+    try:
+        # The import can be re-run after a crash, so not waiting for the WAL flush on every commit is an acceptable trade-off
+        pg_cursor.execute("SET synchronous_commit = off")
+        create_staging_tables(pg_cursor)
+        prepare_statements(pg_cursor)
+
+        torrents_cursor = sqlite_conn.execute(torrents_query)
+        torrent_batches = read_torrent_batches(torrents_cursor, add_files, force_import, batch_size)
+        # Batches are converted in order, by worker processes if requested, and inserted sequentially here
+        if pool:
+            batches_details = get_batches_details_in_pool(pool, torrent_batches, jobs, add_files, add_files_limit, import_padding)
+        else:
+            batches_details = ((records, get_batch_details(batch, add_files, add_files_limit, import_padding)) for records, batch in torrent_batches)
+
+        with tqdm(total=total_count, desc="Processing magnetico records") as pbar:
+            for records, batch_details in batches_details:
+                insert_batch(pg_cursor, source_name, add_files, insert_content, batch_details)
+                pbar.update(records)
+    finally:
+        if torrents_cursor:
+            torrents_cursor.close()
+        pg_cursor.close()
 
 def check_source_exists(pg_conn, source_key):
     """Check if a source key already exists in the database."""
     cur = pg_conn.cursor()
     try:
-        cur.execute(sql.SQL("SELECT 1 FROM torrent_sources WHERE key = %s"), (source_key,))
+        cur.execute(SELECT_SOURCE_SQL, (source_key,))
         return cur.fetchone() is not None
     finally:
         cur.close()
@@ -198,8 +423,7 @@ def insert_source(pg_conn, source_name):
     
     cur = pg_conn.cursor()
     try:
-        cur.execute(sql.SQL("INSERT INTO torrent_sources (key, name, created_at, updated_at) VALUES (%s, %s, %s, %s)"),
-                    (source_key, source_name, timestamp_now, timestamp_now))
+        cur.execute(INSERT_SOURCE_SQL, (source_key, source_name, timestamp_now, timestamp_now))
         pg_conn.commit()
         tqdm.write(f"[INFO]|[SOURCE]: '{source_name}' successfully added.")
     except Exception as e:
@@ -210,15 +434,24 @@ def insert_source(pg_conn, source_name):
     finally:
         cur.close()
 
+def apply_read_pragmas(conn):
+    """Tune the read-only SQLite connection for a single bulk read of the database."""
+    for pragma in READ_PRAGMAS:
+        try:
+            conn.execute(f"PRAGMA {pragma}")
+        except sqlite3.Error:
+            # Older SQLite builds may not support every PRAGMA, these are optimizations only
+            continue
+
 def check_database_column_structure(sqlite_conn, table_name, required_columns):
     """Check if the database has all required columns"""
+    # `pragma_table_info` takes the table name as a parameter and returns no rows when the table does not exist
     cursor = sqlite_conn.cursor()
-    cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
-    if not cursor.fetchone():
+    cursor.execute("SELECT name FROM pragma_table_info(?)", (table_name,))
+    columns = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    if not columns:
         return False, f"Table '{table_name}' does not exist."
-    
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {row[1] for row in cursor.fetchall()}
     missing_columns = required_columns - columns
     if missing_columns:
         return False, f"Missing required columns: {', '.join(missing_columns)}"
@@ -228,8 +461,12 @@ def is_valid_sqlite3_file(database_path):
     """Check if the file at database_path is a valid SQLite3 database file."""
     if not os.path.isfile(database_path):
         return False
-    with open(database_path, 'rb') as f:
-        header = f.read(16)
+    # Read the header with a raw file descriptor, a buffered file object is not needed for 16 bytes
+    fd = os.open(database_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        header = os.read(fd, 16)
+    finally:
+        os.close(fd)
     return header == b'SQLite format 3\000'
 
 def main():
@@ -238,6 +475,9 @@ def main():
     if len(args.source_name) == 0:
         tqdm.write(f"[ERROR]|[ARGS]: --source is set to an empty string.")
         exit(1)
+    if args.jobs <= 0:
+        tqdm.write(f"[ERROR]|[ARGS]: --jobs must be a positive integer. '{args.jobs}' is invalid.")
+        exit(1)
     if not args.add_files:
         tqdm.write(f"[INFO]|[ARGS]: --add-files is not set. Setting this is recommeneded. If you don't set this, 'mutli file' torrents will be imported as '0 files'.")
         tqdm.write(f"[INFO]|[ARGS]: The total size of a torrent will be calculated and imported either way.")
@@ -247,7 +487,7 @@ def main():
         else:
             tqdm.write("[INFO]|[ARGS]: Please set --add-files to acknowledge your choice.")
             exit(1)
-    if not args.insert_content:
+    if not args.insert_torrent_content:
         tqdm.write(f"[INFO]|[ARGS]: --insert-content is not set. Torrents will not show up in the WebUI until `bitmagnet reprocess` has ran.")
         tqdm.write(f"[INFO]|[ARGS]: Enabling --insert-content makes infohashes directly searchable. Either way does `bitmagnet reprocess` need to run to have them searchable.")
         no_insert_content = input(f"[INFO]|[ARGS]: Do you want to continue without inserting content? [y/n]: ").lower()
@@ -269,26 +509,39 @@ def main():
         tqdm.write(f"[ERROR]|[FILE]:'{args.database_path}' is not a valid SQLite3 database.")
         exit(1)
 
-    sqlite_conn = sqlite3.connect(f'file:{args.database_path}?mode=ro', uri=True)
-    torrents_check_result, torrents_check_error = check_database_column_structure(sqlite_conn, "torrents", {"info_hash", "name", "total_size", "discovered_on"})
-    files_check_result, files_check_error = check_database_column_structure(sqlite_conn, "files", {"id", "torrent_id", "size", "path"})
-    if not torrents_check_result:
-        tqdm.write(torrents_check_error)
-        exit(1)
-    if not files_check_result:
-        tqdm.write(files_check_error)
-        exit(1)
+    # The worker processes are started before connecting, so they do not inherit the SQLite and PostgreSQL connections
+    pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+    sqlite_conn = None
+    pg_conn = None
+    try:
+        sqlite_conn = sqlite3.connect(f'file:{args.database_path}?mode=ro', uri=True)
+        apply_read_pragmas(sqlite_conn)
+        torrents_check_result, torrents_check_error = check_database_column_structure(sqlite_conn, "torrents", {"info_hash", "name", "total_size", "discovered_on"})
+        files_check_result, files_check_error = check_database_column_structure(sqlite_conn, "files", {"id", "torrent_id", "size", "path"})
+        if not torrents_check_result:
+            tqdm.write(torrents_check_error)
+            exit(1)
+        if not files_check_result:
+            tqdm.write(files_check_error)
+            exit(1)
 
-    db_params = {
-        "dbname": args.dbname,
-        "user": args.user,
-        "password": args.password,
-        "host": args.host,
-        "port": args.port
-    }
-    pg_conn = psycopg2.connect(**db_params)
-    insert_source(pg_conn, args.source_name)
-    process_magnetico_database(args.database_path, sqlite_conn, pg_conn, args.source_name.lower(), args.add_files, args.add_files_limit, args.insert_torrent_content, args.import_padding, args.force_import)
+        db_params = {
+            "dbname": args.dbname,
+            "user": args.user,
+            "password": args.password,
+            "host": args.host,
+            "port": args.port
+        }
+        pg_conn = psycopg2.connect(**db_params)
+        insert_source(pg_conn, args.source_name)
+        process_magnetico_database(args.database_path, sqlite_conn, pg_conn, args.source_name.lower(), args.add_files, args.add_files_limit, args.insert_torrent_content, args.import_padding, args.force_import, pool, args.jobs)
+    finally:
+        if pool:
+            pool.terminate()
+        if pg_conn:
+            pg_conn.close()
+        if sqlite_conn:
+            sqlite_conn.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""Checks for the COPY text and binary formats written by magnetico2database and torrent2database.
+
+Run from the repository root with `python -m unittest discover tests`, the requirements of both scripts have to be installed.
+"""
+
+import importlib.util
+import os
+import struct
+import unittest
+from datetime import datetime, timezone
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name):
+    """Import one of the standalone scripts as a module."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPOSITORY_ROOT, name, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+magnetico2database = load_script('magnetico2database')
+torrent2database = load_script('torrent2database')
+
+
+class CopyCursor:
+    """Records what is sent with `copy_expert` instead of sending it to PostgreSQL."""
+
+    def __init__(self):
+        self.statement = None
+        self.data = None
+
+    def copy_expert(self, statement, file):
+        self.statement = statement
+        self.data = file.read()
+
+
+class CopyTextTest(unittest.TestCase):
+
+    def test_values(self):
+        for module in (magnetico2database, torrent2database):
+            self.assertEqual(module.copy_text_value(None), '\\N')
+            self.assertEqual(module.copy_text_value(True), 't')
+            self.assertEqual(module.copy_text_value(False), 'f')
+            self.assertEqual(module.copy_text_value(0), '0')
+            self.assertEqual(module.copy_text_value(-5), '-5')
+            # The backslash is escaped for COPY, so bytea receives its `\x` hex format
+            self.assertEqual(module.copy_text_value(b'\x00\xab\xff'), '\\\\x00abff')
+            self.assertEqual(module.copy_text_value('a\tb\nc\rd\\e'), 'a\\tb\\nc\\rd\\\\e')
+            self.assertEqual(module.copy_text_value('日本語'), '日本語')
+            self.assertEqual(module.copy_text_value(datetime(2020, 9, 13, 12, 26, 40, tzinfo=timezone.utc)),
+                             '2020-09-13 12:26:40+00:00')
+
+    def test_rows(self):
+        for module in (magnetico2database, torrent2database):
+            cur = CopyCursor()
+            module.copy_rows(cur, 'torrents_staging', ('info_hash', 'name', 'private'), [(b'\x01', 'a\tb', False), (b'\x02', None, True)])
+            self.assertEqual(cur.statement, 'COPY torrents_staging (info_hash, name, private) FROM STDIN')
+            self.assertEqual(cur.data, '\\\\x01\ta\\tb\tf\n\\\\x02\t\\N\tt\n')
+
+
+class CopyBinaryTest(unittest.TestCase):
+
+    HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00\x00\x00\x00' + b'\x00\x00\x00\x00'
+    TRAILER = b'\xff\xff'
+
+    def field(self, data):
+        return struct.pack('>i', len(data)) + data
+
+    def test_values(self):
+        self.assertEqual(magnetico2database.copy_binary_value(b'\x00\xff'), b'\x00\xff')
+        self.assertEqual(magnetico2database.copy_binary_value('日本'), '日本'.encode('utf-8'))
+        self.assertEqual(magnetico2database.copy_binary_value(True), b'\x01')
+        self.assertEqual(magnetico2database.copy_binary_value(False), b'\x00')
+        self.assertEqual(magnetico2database.copy_binary_value(1), b'\x00\x00\x00\x00\x00\x00\x00\x01')
+        self.assertEqual(magnetico2database.copy_binary_value(-1), b'\xff' * 8)
+        self.assertEqual(magnetico2database.copy_binary_value(2 ** 40), b'\x00\x00\x01\x00\x00\x00\x00\x00')
+
+    def test_timestamps(self):
+        # Timestamps are microseconds since 2000-01-01 UTC, earlier ones are negative
+        values = {
+            datetime(2000, 1, 1, tzinfo=timezone.utc): 0,
+            datetime(2000, 1, 1, 0, 0, 1, 5, tzinfo=timezone.utc): 1000005,
+            datetime(1999, 12, 31, 23, 59, 59, tzinfo=timezone.utc): -1000000,
+            datetime(2020, 9, 13, 12, 26, 40, tzinfo=timezone.utc): 653315200000000,
+        }
+        for value, microseconds in values.items():
+            self.assertEqual(magnetico2database.copy_binary_value(value), struct.pack('>q', microseconds))
+
+    def test_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            magnetico2database.copy_binary_value(1.5)
+
+    def test_rows(self):
+        cur = CopyCursor()
+        created_at = datetime(2000, 1, 1, 0, 0, 2, tzinfo=timezone.utc)
+        rows = [(b'\xaa\xbb', 0, 'a/b.txt', 10, created_at, created_at),
+                (b'\xcc', 1, '', -1, created_at, None)]
+        magnetico2database.copy_binary_rows(cur, 'torrent_files_staging', magnetico2database.TORRENT_FILE_COLUMNS, rows)
+        self.assertEqual(cur.statement, 'COPY torrent_files_staging (info_hash, index, path, size, created_at, updated_at) '
+                                        'FROM STDIN WITH (FORMAT binary)')
+        two_seconds = b'\x00\x00\x00\x00\x00\x1e\x84\x80'
+        expected = (self.HEADER
+                    + b'\x00\x06' + self.field(b'\xaa\xbb') + self.field(b'\x00' * 8) + self.field(b'a/b.txt')
+                    + self.field(b'\x00' * 7 + b'\x0a') + self.field(two_seconds) + self.field(two_seconds)
+                    + b'\x00\x06' + self.field(b'\xcc') + self.field(b'\x00' * 7 + b'\x01') + b'\x00\x00\x00\x00'
+                    + self.field(b'\xff' * 8) + self.field(two_seconds) + b'\xff\xff\xff\xff'
+                    + self.TRAILER)
+        self.assertEqual(cur.data, expected)
+
+    def test_no_rows(self):
+        cur = CopyCursor()
+        magnetico2database.copy_binary_rows(cur, 'torrents_torrent_sources_staging', magnetico2database.TORRENT_SOURCE_COLUMNS, [])
+        self.assertEqual(cur.data, self.HEADER + self.TRAILER)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""Checks for the way magnetico2database reads torrents and their files from a magnetico SQLite database.
+
+Run from the repository root with `python -m unittest discover tests`, the requirements of the script have to be installed.
+"""
+
+import importlib.util
+import os
+import sqlite3
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name):
+    """Import one of the standalone scripts as a module."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPOSITORY_ROOT, name, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+magnetico2database = load_script('magnetico2database')
+
+
+class MagneticoDatabaseTest(unittest.TestCase):
+    """Runs the script's queries against an in-memory database with magnetico's tables."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.conn.execute("CREATE TABLE torrents (id INTEGER PRIMARY KEY, info_hash BLOB NOT NULL UNIQUE, name TEXT NOT NULL, "
+                          "total_size INTEGER NOT NULL, discovered_on INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, torrent_id INTEGER REFERENCES torrents, size INTEGER NOT NULL, path TEXT NOT NULL)")
+        self.conn.text_factory = bytes
+        patcher = mock.patch.object(magnetico2database, 'tqdm')
+        self.tqdm = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_torrent(self, name, files=(), discovered_on=1600000000):
+        """Adds a torrent with (path, size) files and returns its id."""
+        torrent_id = self.conn.execute("SELECT COUNT(*) + 1 FROM torrents").fetchone()[0]
+        self.conn.execute("INSERT INTO torrents VALUES (?, ?, ?, ?, ?)",
+                          (torrent_id, bytes([torrent_id]) * 20, name, sum(size for _, size in files), discovered_on))
+        self.add_files(torrent_id, files)
+        return torrent_id
+
+    def add_files(self, torrent_id, files):
+        self.conn.executemany("INSERT INTO files (torrent_id, size, path) VALUES (?, ?, ?)", [(torrent_id, size, path) for path, size in files])
+
+    def read_batches(self, add_files=True, force_import=False, batch_size=1000):
+        query = magnetico2database.SELECT_TORRENTS_WITH_FILES_SQL if add_files else magnetico2database.SELECT_TORRENTS_SQL
+        return list(magnetico2database.read_torrent_batches(self.conn.execute(query), add_files, force_import, batch_size))
+
+    def read_details(self, add_files=True, add_files_limit=100, import_padding=False, force_import=False):
+        details = []
+        for _, batch in self.read_batches(add_files, force_import):
+            details.extend(magnetico2database.get_batch_details(batch, add_files, add_files_limit, import_padding))
+        return details
+
+
+class ReadTorrentBatchesTest(MagneticoDatabaseTest):
+
+    def test_files_are_grouped_per_torrent(self):
+        first = self.add_torrent('first', [('a/1.txt', 1)])
+        second = self.add_torrent('second', [('b/1.txt', 3)])
+        # Files added later for the first torrent still end up with it, in the order they were added
+        self.add_files(first, [('a/2.txt', 2)])
+        self.add_files(second, [('b/2.txt', 4)])
+        [(records, batch)] = self.read_batches()
+        self.assertEqual(records, 2)
+        self.assertEqual([(torrent[2], files) for torrent, files in batch],
+                         [(b'first', [(1, b'a/1.txt'), (2, b'a/2.txt')]), (b'second', [(3, b'b/1.txt'), (4, b'b/2.txt')])])
+
+    def test_torrent_without_files(self):
+        self.add_torrent('no files')
+        self.add_torrent('with files', [('a', 1), ('b', 2)])
+        [(records, batch)] = self.read_batches()
+        self.assertEqual(records, 2)
+        self.assertEqual([torrent[2] for torrent, _ in batch], [b'with files'])
+        [(records, batch)] = self.read_batches(force_import=True)
+        self.assertEqual(batch[0][1], [])
+
+    def test_empty_file_names(self):
+        self.add_torrent('empty', [('', 1), ('', 2)])
+        self.add_torrent('partly empty', [('', 1), ('b', 2)])
+        [(_, batch)] = self.read_batches()
+        self.assertEqual([torrent[2] for torrent, _ in batch], [b'partly empty'])
+        self.tqdm.write.assert_called_once_with("[INFO]|[DATA]: Record with id 1 only contains empty filenames, skipping.")
+        [(_, batch)] = self.read_batches(force_import=True)
+        self.assertEqual([torrent[2] for torrent, _ in batch], [b'empty', b'partly empty'])
+
+    def test_without_add_files(self):
+        self.add_torrent('no files')
+        self.add_torrent('empty', [('', 1)])
+        [(records, batch)] = self.read_batches(add_files=False)
+        self.assertEqual(records, 2)
+        self.assertEqual([(torrent[2], files) for torrent, files in batch], [(b'no files', []), (b'empty', [])])
+
+    def test_records_count_skipped_torrents(self):
+        for name, files in [('1', [('a', 1)]), ('2', []), ('3', [('a', 1)]), ('4', [('a', 1)]), ('5', [])]:
+            self.add_torrent(name, files)
+        batches = self.read_batches(batch_size=2)
+        self.assertEqual([(records, [torrent[2] for torrent, _ in batch]) for records, batch in batches],
+                         [(3, [b'1', b'3']), (2, [b'4'])])
+
+    def test_last_records_are_counted_without_a_batch(self):
+        for name, files in [('1', [('a', 1)]), ('2', [('a', 1)]), ('3', [])]:
+            self.add_torrent(name, files)
+        batches = self.read_batches(batch_size=2)
+        self.assertEqual([(records, len(batch)) for records, batch in batches], [(2, 2), (1, 0)])
+
+    def test_empty_database(self):
+        self.assertEqual(self.read_batches(), [])
+
+
+class GetTorrentDetailsTest(MagneticoDatabaseTest):
+
+    def test_single_file(self):
+        self.add_torrent('movie.mkv', [('movie.mkv', 700)])
+        [details] = self.read_details()
+        self.assertEqual(details, (b'\x01' * 20, 'movie.mkv', 700, False, datetime(2020, 9, 13, 12, 26, 40, tzinfo=timezone.utc),
+                                   datetime(2020, 9, 13, 12, 26, 40, tzinfo=timezone.utc), 'single', None, [(0, 'movie.mkv', 700)]))
+
+    def test_multi_file(self):
+        self.add_torrent('directory', [('a/b.txt', 1), ('c.txt', 2)])
+        [details] = self.read_details()
+        self.assertEqual(details[2], 3)
+        self.assertEqual(details[6:], ('multi', 2, [(0, 'a/b.txt', 1), (1, 'c.txt', 2)]))
+
+    def test_add_files_limit(self):
+        self.add_torrent('directory', [(f'{index}.txt', index) for index in range(5)])
+        [details] = self.read_details(add_files_limit=5)
+        self.assertEqual(details[6:8], ('multi', 5))
+        [details] = self.read_details(add_files_limit=3)
+        self.assertEqual(details[6:], ('over_threshold', 5, [(0, '0.txt', 0), (1, '1.txt', 1), (2, '2.txt', 2)]))
+
+    def test_padding_files(self):
+        files = [('a.txt', 1), ('.pad/_____padding_file_0_if you see this file', 2), ('b.____padding', 3), ('b.txt', 4)]
+        self.add_torrent('directory', files)
+        [details] = self.read_details()
+        self.assertEqual(details[6:], ('multi', 4, [(0, 'a.txt', 1), (3, 'b.txt', 4)]))
+        [details] = self.read_details(import_padding=True)
+        self.assertEqual([file_info[1] for file_info in details[8]], [path for path, _ in files])
+
+    def test_force_import(self):
+        self.add_torrent('no files')
+        self.add_torrent('empty', [('', 1), ('', 2)])
+        self.assertEqual(self.read_details(), [])
+        no_files, empty = self.read_details(force_import=True)
+        self.assertEqual(no_files[1:3] + no_files[6:], ('no files', 0, 'multi', 0, []))
+        self.assertEqual(empty[1:3] + empty[6:], ('empty', 3, 'multi', 2, [(0, '', 1), (1, '', 2)]))
+
+    def test_without_add_files(self):
+        self.add_torrent('movie.mkv', [('movie.mkv', 700)])
+        self.add_torrent('directory', [('a', 1), ('b', 2)])
+        single, multi = self.read_details(add_files=False)
+        # Without the files every torrent is imported with 0 files
+        self.assertEqual(single[6:], ('multi', 0, []))
+        self.assertEqual(multi[2], 3)
+
+    def test_names_that_are_not_utf8(self):
+        self.add_torrent('名前'.encode('shift_jis'), [('ファイル'.encode('shift_jis'), 1), ('b', 2)])
+        [details] = self.read_details()
+        self.assertEqual(details[1], '名前')
+        self.assertEqual(details[8][0], (0, 'ファイル', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Checks for the output files written by magnetico2bitmagnet.
+
+Run from the repository root with `python -m unittest discover tests`, the requirements of the script have to be installed.
+"""
+
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name):
+    """Import one of the standalone scripts as a module."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPOSITORY_ROOT, name, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    # The worker processes of `--jobs` look the functions up by module name
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+magnetico2bitmagnet = load_script('magnetico2bitmagnet')
+
+
+class OutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def create_database(self, rows):
+        database_path = os.path.join(self.directory.name, 'database.sqlite3')
+        conn = sqlite3.connect(database_path)
+        conn.execute("CREATE TABLE torrents (id INTEGER PRIMARY KEY, info_hash BLOB NOT NULL UNIQUE, name TEXT NOT NULL, "
+                     "total_size INTEGER NOT NULL, discovered_on INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO torrents VALUES (?, ?, ?, ?, ?)",
+                         [(index, index.to_bytes(20, 'big'), f'torrent {index}', index, 1600000000) for index in range(1, rows + 1)])
+        conn.commit()
+        conn.close()
+        return database_path
+
+    def run_main(self, rows, split_size, jobs=1):
+        """Writes `rows` records to the output directory and returns the names of the files with their lines."""
+        output_directory = os.path.join(self.directory.name, 'output')
+        magnetico2bitmagnet.main(self.create_database(rows), os.path.join(output_directory, 'torrents.json'), split_size, True, jobs)
+        output = {}
+        for file_name in os.listdir(output_directory):
+            with open(os.path.join(output_directory, file_name), 'rb') as output_file:
+                output[file_name] = [json.loads(line) for line in output_file]
+        return output
+
+    def test_split_size(self):
+        output = self.run_main(25, 10)
+        self.assertEqual({file_name: len(lines) for file_name, lines in output.items()},
+                         {'torrents.json': 10, 'torrents-11.json': 10, 'torrents-21.json': 5})
+        self.assertEqual(output['torrents-11.json'][0]['name'], 'torrent 11')
+        self.assertEqual(output['torrents-21.json'][-1]['name'], 'torrent 25')
+
+    def test_split_size_without_remainder(self):
+        # No empty file is opened when the last file is exactly full
+        output = self.run_main(20, 10)
+        self.assertEqual({file_name: len(lines) for file_name, lines in output.items()}, {'torrents.json': 10, 'torrents-11.json': 10})
+
+    def test_split_size_with_jobs(self):
+        output = self.run_main(25, 10, jobs=2)
+        names = [line['name'] for file_name in ('torrents.json', 'torrents-11.json', 'torrents-21.json') for line in output[file_name]]
+        self.assertEqual(names, [f'torrent {index}' for index in range(1, 26)])
+
+    def test_output_without_split_size(self):
+        output = self.run_main(25, None)
+        self.assertEqual(list(output), ['torrents.json'])
+        self.assertEqual([line['name'] for line in output['torrents.json']], [f'torrent {index}' for index in range(1, 26)])
+        self.assertEqual(output['torrents.json'][0], {'infoHash': (1).to_bytes(20, 'big').hex(), 'name': 'torrent 1', 'size': 1,
+                                                       'publishedAt': '2020-09-13T12:26:40.000Z', 'source': 'magnetico'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Checks for the .torrent parsing shared by torrent2bitmagnet and torrent2database.
+
+Run from the repository root with `python -m unittest discover tests`, the requirements of both scripts have to be installed.
+"""
+
+import hashlib
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import bencodepy
+from charset_normalizer import from_bytes
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name):
+    """Import one of the standalone scripts as a module."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPOSITORY_ROOT, name, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+torrent2bitmagnet = load_script('torrent2bitmagnet')
+torrent2database = load_script('torrent2database')
+
+
+def encode_in_order(value):
+    """Bencode a value like bencodepy, but keep the order of the dictionary keys as given."""
+    if isinstance(value, int):
+        return b'i%de' % value
+    if isinstance(value, bytes):
+        return b'%d:%s' % (len(value), value)
+    if isinstance(value, list):
+        return b'l' + b''.join(encode_in_order(item) for item in value) + b'e'
+    return b'd' + b''.join(encode_in_order(key) + encode_in_order(item) for key, item in value.items()) + b'e'
+
+
+def single_file_info(name=b'single.bin', length=1234):
+    return {b'length': length, b'name': name, b'piece length': 16384, b'pieces': b'\x01' * 20}
+
+
+def multi_file_info(files, name=b'directory'):
+    return {b'files': [{b'length': length, b'path': path} for path, length in files],
+            b'name': name, b'piece length': 16384, b'pieces': b'\x02' * 40}
+
+
+def original_decode_with_fallback(byte_sequence):
+    """The charset_normalizer only decoding that `decode_with_fallback` used before its UTF-8 fast path."""
+    matches = from_bytes(
+        byte_sequence,
+        cp_isolation=['utf-8', 'shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1'],
+        threshold=0.2,
+        language_threshold=0.1,
+        enable_fallback=True
+    )
+    return str(matches.best())
+
+
+class TorrentFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_torrent(self, torrent_bytes, file_name='test.torrent'):
+        torrent_path = os.path.join(self.directory.name, file_name)
+        with open(torrent_path, 'wb') as torrent_file:
+            torrent_file.write(torrent_bytes)
+        return torrent_path
+
+    def get_info_hashes(self, torrent_bytes):
+        """Returns the info hash computed by torrent2bitmagnet and torrent2database."""
+        torrent_path = self.write_torrent(torrent_bytes)
+        bitmagnet_details = torrent2bitmagnet.get_torrent_details(torrent_path)
+        database_details = torrent2database.get_torrent_details(torrent_path, True, 100, False)
+        return bitmagnet_details[0], database_details.info_hash
+
+
+class InfoHashTest(TorrentFileTestCase):
+    """The info dictionary is hashed from the raw file instead of being encoded again with bencodepy."""
+
+    def assert_same_as_encoded(self, torrent_bytes):
+        # This is how the info hash was computed before, by decoding the torrent and encoding the info dictionary again
+        expected = hashlib.sha1(bencodepy.encode(bencodepy.decode(torrent_bytes)[b'info']))
+        bitmagnet_hash, database_hash = self.get_info_hashes(torrent_bytes)
+        self.assertEqual(bitmagnet_hash, expected.hexdigest())
+        self.assertEqual(database_hash, expected.digest())
+
+    def test_single_file_torrent(self):
+        self.assert_same_as_encoded(bencodepy.encode({b'announce': b'http://tracker.example/announce', b'creation date': 1600000000,
+                                                      b'info': single_file_info()}))
+
+    def test_multi_file_torrent_with_nested_values(self):
+        info = multi_file_info([([b'a', b'b.txt'], 1), ([b'c' * 300], 2 ** 40)])
+        info[b'private'] = 1
+        self.assert_same_as_encoded(bencodepy.encode({b'announce-list': [[b'http://a/announce'], [b'udp://b:80']],
+                                                      b'info': info, b'url-list': [b'http://seed/']}))
+
+    def test_keys_after_info(self):
+        self.assert_same_as_encoded(bencodepy.encode({b'comment': b'info', b'info': single_file_info(), b'z': {b'info': b'not this one'}}))
+
+    def test_info_is_the_last_key(self):
+        self.assert_same_as_encoded(bencodepy.encode({b'announce': b'http://a/announce', b'info': single_file_info()}))
+
+    def test_negative_and_zero_integers(self):
+        info = single_file_info(length=-5)
+        info[b'x-offset'] = 0
+        self.assert_same_as_encoded(bencodepy.encode({b'info': info}))
+
+    def test_unsorted_keys(self):
+        # Clients hash the info dictionary exactly as it is stored, so keys out of order have to stay out of order
+        info = {b'pieces': b'\x03' * 20, b'name': b'unsorted', b'length': 10, b'piece length': 16384}
+        torrent_bytes = encode_in_order({b'info': info, b'announce': b'http://a/announce'})
+        self.assert_same_as_encoded(torrent_bytes)
+        bitmagnet_hash, database_hash = self.get_info_hashes(torrent_bytes)
+        self.assertEqual(database_hash, hashlib.sha1(encode_in_order(info)).digest())
+        self.assertNotEqual(database_hash, hashlib.sha1(encode_in_order(dict(sorted(info.items())))).digest())
+
+    def test_unsorted_keys_with_info_last(self):
+        info = {b'name': b'last', b'length': 1, b'pieces': b'\x04' * 20, b'piece length': 16384}
+        self.assert_same_as_encoded(encode_in_order({b'created by': b'x', b'announce': b'http://a/announce', b'info': info}))
+
+    def test_info_span_matches_encoded_info(self):
+        info = multi_file_info([([b'1:e', b'i5e'], 5), ([b'd', b'l'], 0)])
+        for module in (torrent2bitmagnet, torrent2database):
+            torrent_bytes = bencodepy.encode({b'a': [1, {b'info': 2}], b'info': info})
+            start, end = module.get_info_span(torrent_bytes)
+            self.assertEqual(torrent_bytes[start:end], bencodepy.encode(info))
+
+    def test_missing_info(self):
+        for module in (torrent2bitmagnet, torrent2database):
+            with self.assertRaises(KeyError):
+                module.get_info_span(bencodepy.encode({b'announce': b'http://a/announce'}))
+
+
+class DecodeTest(unittest.TestCase):
+    """The UTF-8 fast path and the joined path decoding give the same text as decoding with charset_normalizer."""
+
+    NAMES = [b'Plain.Name.2020.1080p', 'Ünïcödé'.encode(), '中文名字'.encode(), 'Сидя дома'.encode(),
+             '日本語のファイル名'.encode(), b'tab\tand\\back']
+
+    def test_utf8_names(self):
+        for name in self.NAMES:
+            for module in (torrent2bitmagnet, torrent2database):
+                self.assertEqual(module.decode_with_fallback(name), original_decode_with_fallback(name))
+
+    def test_joined_paths(self):
+        for parts in ([b'Season 1', b'Episode 1.mkv'], ['目录'.encode(), 'ファイル.txt'.encode()], [b'single']):
+            # bitmagnet stores paths with '/' on every platform
+            joined = torrent2database.decode_with_fallback(b'/'.join(parts))
+            self.assertEqual(joined, '/'.join([original_decode_with_fallback(part) for part in parts]))
+
+
+class TorrentDetailsTest(TorrentFileTestCase):
+    """The single file and multi file paths of torrent2database's `get_torrent_details`."""
+
+    def get_details(self, info, add_files=True, add_files_limit=100, import_padding=False, torrent=None):
+        torrent_path = self.write_torrent(bencodepy.encode({b'info': info, **(torrent or {})}))
+        return torrent2database.get_torrent_details(torrent_path, add_files, add_files_limit, import_padding)
+
+    def test_single_file(self):
+        details = self.get_details(single_file_info(b'movie.mkv', 700))
+        self.assertEqual((details.name, details.size, details.files_status, details.files_count), ('movie.mkv', 700, 'single', None))
+        self.assertEqual(details.files_info, [(0, 'movie.mkv', 700)])
+        self.assertEqual(self.get_details(single_file_info(), add_files=False).files_info, [])
+
+    def test_multi_file(self):
+        details = self.get_details(multi_file_info([([b'a', b'b.txt'], 1), ([b'c.txt'], 2)]))
+        self.assertEqual((details.size, details.files_status, details.files_count), (3, 'multi', 2))
+        self.assertEqual(details.files_info, [(0, 'a/b.txt', 1), (1, 'c.txt', 2)])
+
+    def test_file_limit(self):
+        files = [([b'%d.txt' % index], index) for index in range(5)]
+        self.assertEqual(self.get_details(multi_file_info(files), add_files_limit=5).files_status, 'multi')
+        details = self.get_details(multi_file_info(files), add_files_limit=3)
+        self.assertEqual((details.size, details.files_status, details.files_count), (10, 'over_threshold', 5))
+        self.assertEqual([file_info[0] for file_info in details.files_info], [0, 1, 2])
+
+    def test_padding_files(self):
+        files = [([b'a.txt'], 1), ([b'.pad', b'_____padding_file_0_if you see this file'], 2), ([b'b.____padding'], 3), ([b'b.txt'], 4)]
+        details = self.get_details(multi_file_info(files))
+        self.assertEqual(details.files_info, [(0, 'a.txt', 1), (3, 'b.txt', 4)])
+        self.assertEqual(len(self.get_details(multi_file_info(files), import_padding=True).files_info), 4)
+
+    def test_utf8_keys(self):
+        info = multi_file_info([([b'\x83t\x83@\x83C\x83\x8b'], 1)], name=b'\x96\xbc\x91O')
+        info[b'name.utf-8'] = '名前'.encode()
+        info[b'files'][0][b'path.utf-8'] = ['ファイル'.encode()]
+        details = self.get_details(info)
+        self.assertEqual((details.name, details.files_info), ('名前', [(0, 'ファイル', 1)]))
+
+    def test_creation_date(self):
+        info = single_file_info()
+        self.assertEqual(self.get_details(info, torrent={b'creation date': 1600000000}).created_at, '2020-09-13T12:26:40.000Z')
+        self.assertIsNone(self.get_details(info).created_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
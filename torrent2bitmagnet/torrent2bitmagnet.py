@@ -4,11 +4,42 @@ __version__ = '2024.03.08b'
 
 import json
 import argparse
+import collections
+import concurrent.futures
 import os
 import bencodepy
 import hashlib
 from datetime import datetime
 import sys
+import itertools
+import multiprocessing
+
+try:
+    import orjson
+
+    def dump_json(data):
+        """Serialize data to compact UTF-8 encoded JSON using orjson."""
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            # orjson only supports 64-bit integers, a bad .torrent can report a larger size
+            return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+except ImportError:
+    def dump_json(data):
+        """Serialize data to compact UTF-8 encoded JSON, used when orjson is not installed."""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+try:
+    from fastbencode import bdecode as fast_bdecode
+except ImportError:
+    fast_bdecode = None
+
+# Size of the write buffer used for the output file or stdout
+WRITE_BUFFER_SIZE = 1 << 20
+# Number of .torrent files handed to a worker process at once when `--jobs` is larger than 1
+JOBS_CHUNK_SIZE = 64
+# Encodings tried in order by `decode_with_fallback` when a name is not valid UTF-8
+FALLBACK_ENCODINGS = ('shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='torrent2bitmagnet processes a directory (recursively) with .torrent files in it to extract and print data in a bitmagnet supported JSON format.', formatter_class=argparse.RawTextHelpFormatter)
@@ -19,11 +50,20 @@ def parse_arguments():
     parser.add_argument('-r', '--recursive', action='store_true', help='Recursively find .torrent files in subdirectories of the <directory_path>.')
     parser.add_argument('--negative-to-zero', action='store_true', help='Rarely a bad .torrent can report a negative size. Set this argument to set the size to "0" to allow importing them.')
     parser.add_argument('--auto-create-dir', action='store_true', help='Automatically create the output directory if it does not exist, without prompting.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to read the .torrent files, default is 1.')
+    parser.add_argument('--walk-jobs', type=int, default=4, help='Number of threads used to search subdirectories for .torrent files with `--recursive`, default is 4.')
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}', help="Show the script's version and exit")
     return parser.parse_args()
 
-def decode_with_fallback(byte_sequence, encodings=('utf-8', 'shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1')):
+def decode_with_fallback(byte_sequence, encodings=FALLBACK_ENCODINGS):
     """Attempt to decode a byte sequence using a list of encodings, falling back to a lossy decoding if necessary."""
+    # Most names are plain ASCII or valid UTF-8, handle those before trying the other encodings
+    if byte_sequence.isascii():
+        return byte_sequence.decode('ascii')
+    try:
+        return byte_sequence.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
     for encoding in encodings:
         try:
             return byte_sequence.decode(encoding)
@@ -57,43 +97,124 @@ def generate_output_file_path(base_path, counter, split_size):
         new_filename = f"{filename}-{counter * split_size + 1}{ext}"
         return os.path.join(base_directory, new_filename)
 
+def decode_torrent(torrent_bytes):
+    """Decodes bencoded data, using fastbencode when it is installed and bencodepy otherwise."""
+    if fast_bdecode is not None:
+        try:
+            return fast_bdecode(torrent_bytes)
+        except ValueError:
+            # fastbencode rejects some data bencodepy accepts, like dictionaries with unsorted keys
+            pass
+    return bencodepy.decode(torrent_bytes)
+
+def bencoded_value_end(data, index):
+    """Returns the index right after the bencoded value that starts at `index`."""
+    token = data[index]
+    if token == 0x69: # 'i', an integer
+        return data.index(b'e', index) + 1
+    if token == 0x6c or token == 0x64: # 'l' or 'd', a list or dictionary
+        index += 1
+        while data[index] != 0x65: # 'e'
+            index = bencoded_value_end(data, index)
+        return index + 1
+    colon = data.index(b':', index)
+    return colon + 1 + int(data[index:colon])
+
+def get_info_span(torrent_bytes):
+    """Returns the start and end of the bencoded info dictionary in the raw torrent data."""
+    index = 1
+    while torrent_bytes[index] != 0x65: # 'e', the end of the torrent's dictionary
+        key_end = bencoded_value_end(torrent_bytes, index)
+        value_end = bencoded_value_end(torrent_bytes, key_end)
+        if torrent_bytes[index:key_end] == b'4:info':
+            return key_end, value_end
+        index = value_end
+    raise KeyError(b'info')
+
 def get_torrent_details(torrent_path):
-    """Extracts torrent details using bencodepy."""
+    """Extracts torrent details using fastbencode or bencodepy."""
     try:
-        torrent_data = bencodepy.decode_from_file(torrent_path)
+        with open(torrent_path, 'rb') as torrent_file:
+            torrent_bytes = torrent_file.read()
+        torrent_data = decode_torrent(torrent_bytes)
         info_dict = torrent_data[b'info']
-        info_encoded = bencodepy.encode(info_dict)
-        info_hash = hashlib.sha1(info_encoded).hexdigest()
+        # The info dictionary is hashed as it is stored in the file, instead of encoding the decoded dictionary again
+        info_start, info_end = get_info_span(torrent_bytes)
+        info_hash = hashlib.sha1(memoryview(torrent_bytes)[info_start:info_end]).hexdigest()
         creation_date = torrent_data.get(b'creation date')
         if creation_date:
             creation_date = datetime.utcfromtimestamp(creation_date).strftime('%Y-%m-%dT%H:%M:%S.000Z')
         else:
             creation_date = 'Not available'
-        total_size = 0
         if b'files' in info_dict:
-            for file in info_dict[b'files']:
-                total_size += file[b'length']
+            total_size = sum(file[b'length'] for file in info_dict[b'files'])
         else:
             total_size = info_dict[b'length']
-        name = decode_with_fallback(info_dict[b'name'])
+        # Clients that store names in another encoding add a UTF-8 copy of them in `name.utf-8`, it is used when present
+        name = decode_with_fallback(info_dict.get(b'name.utf-8') or info_dict[b'name'])
         return info_hash, name, total_size, creation_date
     except Exception as e:
         print(f"Error processing '{torrent_path}': {e}", file=sys.stderr)
         return None
 
-def find_torrent_files(directory_path, recursive):
-    """Finds .torrent files in the given directory, optionally searching recursively."""
-    torrent_files = []
-    if recursive:
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                if file.endswith('.torrent'):
-                    torrent_files.append(os.path.join(root, file))
-    else:
-        torrent_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith('.torrent')]
-    return torrent_files
+def read_torrent_file(torrent_path):
+    """Returns the path of a .torrent file together with its details, runs in a worker process when `--jobs` is larger than 1."""
+    return torrent_path, get_torrent_details(torrent_path)
+
+def read_torrent_files(torrent_paths):
+    """Reads a chunk of .torrent files, runs in a worker process when `--jobs` is larger than 1."""
+    return [read_torrent_file(torrent_path) for torrent_path in torrent_paths]
+
+def read_torrent_files_in_pool(pool, torrent_paths, jobs):
+    """Reads chunks of .torrent files in the worker pool, yielding the results in order with a limited number of chunks in flight."""
+    in_flight = collections.deque()
+    while True:
+        chunk = list(itertools.islice(torrent_paths, JOBS_CHUNK_SIZE))
+        if not chunk:
+            break
+        in_flight.append(pool.apply_async(read_torrent_files, (chunk,)))
+        if len(in_flight) > jobs * 2:
+            yield from in_flight.popleft().get()
+    while in_flight:
+        yield from in_flight.popleft().get()
+
+def scan_directory(directory_path, recursive):
+    """Returns the .torrent files and, when searching recursively, the subdirectories of a single directory."""
+    torrent_paths = []
+    subdirectories = []
+    # The file type comes from the directory entry itself, so only symlinks and unusual file systems need an extra stat()
+    try:
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.torrent') and entry.is_file():
+                    torrent_paths.append(entry.path)
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+    except OSError as e:
+        # A directory that cannot be read is reported and skipped, the rest of the search continues
+        print(f"Error: Skipping '{directory_path}', it could not be read: {e}", file=sys.stderr)
+    return torrent_paths, subdirectories
 
-def process_torrent_directory(directory_path, source, output_file, split_size, auto_create_dir, recursive, negative_to_zero):
+def find_torrent_files(directory_path, recursive, walk_jobs):
+    """Finds .torrent files in the given directory, optionally searching recursively. The paths are yielded as they are found."""
+    # Directories are searched breadth first and their results are used in the order they were queued,
+    # so the order of the paths is the same for every `--walk-jobs` value
+    if walk_jobs == 1 or not recursive:
+        directories = collections.deque([directory_path])
+        while directories:
+            torrent_paths, subdirectories = scan_directory(directories.popleft(), recursive)
+            directories.extend(subdirectories)
+            yield from torrent_paths
+        return
+    # Directories are read ahead by a pool of threads, os.scandir releases the GIL while it waits on the file system
+    with concurrent.futures.ThreadPoolExecutor(max_workers=walk_jobs) as executor:
+        pending = collections.deque([executor.submit(scan_directory, directory_path, recursive)])
+        while pending:
+            torrent_paths, subdirectories = pending.popleft().result()
+            pending.extend(executor.submit(scan_directory, subdirectory, recursive) for subdirectory in subdirectories)
+            yield from torrent_paths
+
+def process_torrent_directory(directory_path, source, output_file, split_size, auto_create_dir, recursive, negative_to_zero, jobs, walk_jobs):
     """Processes all .torrent files in the given directory, optionally searching recursively."""
     if not os.path.exists(directory_path):
         print(f"Error: The directory path '{directory_path}' does not exist.", file=sys.stderr)
@@ -102,64 +223,73 @@ def process_torrent_directory(directory_path, source, output_file, split_size, a
         print(f"Error: The path '{directory_path}' is not a directory.", file=sys.stderr)
         exit(1)
 
-    torrent_files = find_torrent_files(directory_path, recursive)
+    torrent_files = find_torrent_files(directory_path, recursive, walk_jobs)
+    first_torrent_file = next(torrent_files, None)
 
-    if not torrent_files:
+    if first_torrent_file is None:
         if not recursive:
             print(f"Error: No .torrent files found in '{directory_path}'.", file=sys.stderr)
         else:
             print(f"Error: No .torrent files found in '{directory_path}' and the underlying directories.", file=sys.stderr)
         return
-            
+    torrent_files = itertools.chain((first_torrent_file,), torrent_files)
 
     f = None
+    out = None
+    pool = None
     current_record = 0
     file_counter = 0
+    try:
+        if not output_file:
+            sys.stdout.flush()
+            out = open(sys.stdout.fileno(), 'wb', buffering=WRITE_BUFFER_SIZE, closefd=False)
 
-    for torrent_path in torrent_files:
-        details = get_torrent_details(torrent_path)
-        if details is None:
-            continue
-        if details[2] < 0: # Torrent has a negative size
-            if negative_to_zero:
-                temp_details = list(details)
-                temp_details[2] = 0
-                details = tuple(temp_details)
-            else:
-                print(f"Unable to process '{torrent_path}', metadata contains a negative 'size' value.", file=sys.stderr)
-                continue
-        info_hash, name, total_size, creation_date = details
-
-        if output_file and (current_record % split_size == 0):
-            ensure_directory_exists(output_file, auto_create_dir)
-            if f:
-                f.close()
-            new_output_file = generate_output_file_path(output_file, file_counter, split_size)
-            f = open(new_output_file, 'w', encoding='utf-8', newline='\n')
-            file_counter += 1
-
-        data = {
-            "infoHash": info_hash,
-            "name": name,
-            "size": total_size,
-            "source": source
-        }
-
-        # Add 'publishedAt' only if creation_date is available
-        if creation_date != "Not available":
-            data["publishedAt"] = creation_date
-
-        # Convert the dictionary to JSON
-        json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-
-        if output_file:
-            f.write(json_data + '\n')
+        # The .torrent files are read in order, by worker processes if requested, and the output is written sequentially here
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
+            torrents_details = read_torrent_files_in_pool(pool, torrent_files, jobs)
         else:
-            print(json_data)
-        current_record += 1
+            torrents_details = map(read_torrent_file, torrent_files)
+
+        for torrent_path, details in torrents_details:
+            if details is None:
+                continue
+            if details[2] < 0: # Torrent has a negative size
+                if negative_to_zero:
+                    temp_details = list(details)
+                    temp_details[2] = 0
+                    details = tuple(temp_details)
+                else:
+                    print(f"Unable to process '{torrent_path}', metadata contains a negative 'size' value.", file=sys.stderr)
+                    continue
+            info_hash, name, total_size, creation_date = details
 
-    if f:
-        f.close()
+            if output_file and (current_record % split_size == 0):
+                ensure_directory_exists(output_file, auto_create_dir)
+                if f:
+                    f.close()
+                new_output_file = generate_output_file_path(output_file, file_counter, split_size)
+                f = out = open(new_output_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+                file_counter += 1
+
+            data = {
+                "infoHash": info_hash,
+                "name": name,
+                "size": total_size,
+                "source": source
+            }
+
+            # Add 'publishedAt' only if creation_date is available
+            if creation_date != "Not available":
+                data["publishedAt"] = creation_date
+
+            out.write(dump_json(data) + b'\n')
+            current_record += 1
+    finally:
+        if pool:
+            pool.terminate()
+        if out:
+            out.close()
 
 if __name__ == '__main__':
     args = parse_arguments()
@@ -172,4 +302,12 @@ if __name__ == '__main__':
         print(f"split-size must be a positive integer. '{args.split_size}' is invalid.", file=sys.stderr)
         exit(1)
 
-    process_torrent_directory(args.directory_path, args.source, args.output, args.split_size, args.auto_create_dir, args.recursive, args.negative_to_zero)
+    if args.jobs <= 0:
+        print(f"jobs must be a positive integer. '{args.jobs}' is invalid.", file=sys.stderr)
+        exit(1)
+
+    if args.walk_jobs <= 0:
+        print(f"walk-jobs must be a positive integer. '{args.walk_jobs}' is invalid.", file=sys.stderr)
+        exit(1)
+
+    process_torrent_directory(args.directory_path, args.source, args.output, args.split_size, args.auto_create_dir, args.recursive, args.negative_to_zero, args.jobs, args.walk_jobs)
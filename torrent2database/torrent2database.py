@@ -3,16 +3,81 @@
 __version__ = '2024.04.23b'
 
 import argparse
+import collections
+import concurrent.futures
+import functools
+import io
+import itertools
+import multiprocessing
 import os
 import bencodepy
 import hashlib
 import psycopg2
-from psycopg2 import sql
 from datetime import datetime, timezone
-from pathlib import Path
 from tqdm import tqdm
 from charset_normalizer import from_bytes
 
+try:
+    from fastbencode import bdecode as fast_bdecode
+except ImportError:
+    fast_bdecode = None
+
+# Number of names and file paths that are not valid UTF-8 remembered by `decode_with_charset_normalizer`
+DECODE_CACHE_SIZE = 8192
+# Number of .torrent files handed to a worker process at once when `--jobs` is larger than 1
+JOBS_CHUNK_SIZE = 64
+# Columns of the torrents table filled by this script
+TORRENT_COLUMNS = ('info_hash', 'name', 'size', 'private', 'created_at', 'updated_at', 'files_status', 'files_count')
+# Columns of the torrent_files table filled by this script
+TORRENT_FILE_COLUMNS = ('info_hash', 'index', 'path', 'size', 'created_at', 'updated_at')
+# Columns of the torrents_torrent_sources table filled by this script
+TORRENT_SOURCE_COLUMNS = ('source', 'info_hash', 'published_at', 'created_at', 'updated_at')
+# Columns of the torrent_contents staging table, `tsv` is computed from the info hash when the rows are merged
+TORRENT_CONTENT_COLUMNS = ('info_hash', 'languages', 'created_at', 'updated_at')
+# Statements prepared once per session by `prepare_statements`, the staging merges run for every batch
+# and the single row INSERT statements are used when a batch has to be retried row by row
+PREPARE_STATEMENTS = (
+    "PREPARE merge_torrents AS "
+    f"INSERT INTO torrents ({', '.join(TORRENT_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_COLUMNS)} FROM torrents_staging ON CONFLICT (info_hash) DO NOTHING",
+    "PREPARE merge_torrent_files AS "
+    f"INSERT INTO torrent_files ({', '.join(TORRENT_FILE_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_FILE_COLUMNS)} FROM torrent_files_staging ON CONFLICT (info_hash, path) DO NOTHING",
+    "PREPARE merge_torrent_sources AS "
+    f"INSERT INTO torrents_torrent_sources ({', '.join(TORRENT_SOURCE_COLUMNS)}) "
+    f"SELECT {', '.join(TORRENT_SOURCE_COLUMNS)} FROM torrents_torrent_sources_staging ON CONFLICT (source, info_hash) DO NOTHING",
+    "PREPARE merge_torrent_contents AS "
+    f"INSERT INTO torrent_contents ({', '.join(TORRENT_CONTENT_COLUMNS)}, tsv) "
+    f"SELECT {', '.join(TORRENT_CONTENT_COLUMNS)}, to_tsvector(encode(info_hash, 'hex')) "
+    "FROM torrent_contents_staging ON CONFLICT DO NOTHING",
+    "PREPARE insert_torrent AS "
+    "INSERT INTO torrents (info_hash, name, size, private, created_at, updated_at, files_status, files_count) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8) ON CONFLICT (info_hash) DO NOTHING",
+    "PREPARE insert_torrent_file AS "
+    "INSERT INTO torrent_files (info_hash, index, path, size, created_at, updated_at) "
+    "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (info_hash, path) DO NOTHING",
+    "PREPARE insert_torrent_source AS "
+    "INSERT INTO torrents_torrent_sources (source, info_hash, published_at, created_at, updated_at) "
+    "VALUES ($1, $2, $3, $4, $5) ON CONFLICT (source, info_hash) DO NOTHING",
+    "PREPARE insert_torrent_content AS "
+    "INSERT INTO torrent_contents (info_hash, languages, created_at, updated_at, tsv) "
+    "VALUES ($1, $2, $3, $4, to_tsvector($5)) ON CONFLICT DO NOTHING",
+)
+EXECUTE_MERGE_TORRENTS = "EXECUTE merge_torrents"
+EXECUTE_MERGE_TORRENT_FILES = "EXECUTE merge_torrent_files"
+EXECUTE_MERGE_TORRENT_SOURCES = "EXECUTE merge_torrent_sources"
+EXECUTE_MERGE_TORRENT_CONTENTS = "EXECUTE merge_torrent_contents"
+EXECUTE_INSERT_TORRENT = "EXECUTE insert_torrent (%s, %s, %s, %s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_FILE = "EXECUTE insert_torrent_file (%s, %s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_SOURCE = "EXECUTE insert_torrent_source (%s, %s, %s, %s, %s)"
+EXECUTE_INSERT_TORRENT_CONTENT = "EXECUTE insert_torrent_content (%s, %s, %s, %s, %s)"
+SELECT_SOURCE_SQL = "SELECT 1 FROM torrent_sources WHERE key = %s"
+INSERT_SOURCE_SQL = "INSERT INTO torrent_sources (key, name, created_at, updated_at) VALUES (%s, %s, %s, %s)"
+# Details of a single torrent returned by `get_torrent_details`, all fields but `files_info` form a row of the torrents table
+TorrentDetails = collections.namedtuple('TorrentDetails', TORRENT_COLUMNS[:6] + ('files_status', 'files_count', 'files_info'))
+# Characters that have to be escaped in PostgreSQL's COPY text format
+COPY_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="torrent2databse processes a directory (recursively) with .torrent files in it and inserts the data directory into the bitmagnet PostgreSQL database.")
     parser.add_argument("directory_path", nargs='?', help="The path to the directory containing .torrent files.\nIf not provided, the script will prompt for it.")
@@ -30,10 +95,21 @@ def parse_arguments():
     parser.add_argument('--insert-torrent-content', "--insert-content", action='store_true', help='Insert data into the "torrent_content" column to make hashes directly searchable (not recommended).')
     parser.add_argument('--beta', action='store_true', help='Run this script which bitmagnet beta compatibility (unused).')
     parser.add_argument("-r", "--recursive", action="store_true", help='Recursively find .torrent files in subdirectories of the <directory_path>.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to read the .torrent files, default is 1.')
+    parser.add_argument('--walk-jobs', type=int, default=4, help='Number of threads used to search subdirectories for .torrent files with `--recursive`, default is 4.')
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}', help="Show the script's version and exit")
     return parser.parse_args()
 
 def decode_with_fallback(byte_sequence, preferred_encoding=None):
+    # Most names are valid UTF-8, charset_normalizer is only used to guess the encoding of the others
+    try:
+        return byte_sequence.decode('utf-8')
+    except UnicodeDecodeError:
+        return decode_with_charset_normalizer(byte_sequence)
+
+@functools.lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_with_charset_normalizer(byte_sequence):
+    """Guess the encoding of bytes that are not valid UTF-8, the result is cached since guessing is slow."""
     matches = from_bytes(
         byte_sequence,
         cp_isolation=['utf-8', 'shift_jis', 'euc_jp', 'gbk', 'gb18030', 'cp1251', 'latin1'],
@@ -44,129 +120,292 @@ def decode_with_fallback(byte_sequence, preferred_encoding=None):
 
     return str(matches.best())
 
-def find_torrent_files(directory_path, recursive):
-    if recursive:
-        return Path(directory_path).rglob('*.torrent')
-    else:
-        return Path(directory_path).glob('*.torrent')
+def scan_directory(directory_path, recursive):
+    """Returns the .torrent files and, when searching recursively, the subdirectories of a single directory."""
+    torrent_paths = []
+    subdirectories = []
+    # The file type comes from the directory entry itself, so only symlinks and unusual file systems need an extra stat()
+    try:
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.torrent') and entry.is_file():
+                    torrent_paths.append(entry.path)
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+    except OSError as e:
+        # A directory that cannot be read is reported and skipped, the rest of the search continues
+        tqdm.write(f"[ERROR]|[DIRECTORY]: Skipping '{directory_path}', it could not be read: {e}")
+    return torrent_paths, subdirectories
+
+def find_torrent_files(directory_path, recursive, walk_jobs):
+    """Finds .torrent files in the given directory, optionally searching recursively. The paths are yielded as they are found."""
+    # Directories are searched breadth first and their results are used in the order they were queued,
+    # so the order of the paths is the same for every `--walk-jobs` value
+    if walk_jobs == 1 or not recursive:
+        directories = collections.deque([directory_path])
+        while directories:
+            torrent_paths, subdirectories = scan_directory(directories.popleft(), recursive)
+            directories.extend(subdirectories)
+            yield from torrent_paths
+        return
+    # Directories are read ahead by a pool of threads, os.scandir releases the GIL while it waits on the file system
+    with concurrent.futures.ThreadPoolExecutor(max_workers=walk_jobs) as executor:
+        pending = collections.deque([executor.submit(scan_directory, directory_path, recursive)])
+        while pending:
+            torrent_paths, subdirectories = pending.popleft().result()
+            pending.extend(executor.submit(scan_directory, subdirectory, recursive) for subdirectory in subdirectories)
+            yield from torrent_paths
+
+def decode_torrent(torrent_bytes):
+    """Decodes bencoded data, using fastbencode when it is installed and bencodepy otherwise."""
+    if fast_bdecode is not None:
+        try:
+            return fast_bdecode(torrent_bytes)
+        except ValueError:
+            # fastbencode rejects some data bencodepy accepts, like dictionaries with unsorted keys
+            pass
+    return bencodepy.decode(torrent_bytes)
+
+def bencoded_value_end(data, index):
+    """Returns the index right after the bencoded value that starts at `index`."""
+    token = data[index]
+    if token == 0x69: # 'i', an integer
+        return data.index(b'e', index) + 1
+    if token == 0x6c or token == 0x64: # 'l' or 'd', a list or dictionary
+        index += 1
+        while data[index] != 0x65: # 'e'
+            index = bencoded_value_end(data, index)
+        return index + 1
+    colon = data.index(b':', index)
+    return colon + 1 + int(data[index:colon])
+
+def get_info_span(torrent_bytes):
+    """Returns the start and end of the bencoded info dictionary in the raw torrent data."""
+    index = 1
+    while torrent_bytes[index] != 0x65: # 'e', the end of the torrent's dictionary
+        key_end = bencoded_value_end(torrent_bytes, index)
+        value_end = bencoded_value_end(torrent_bytes, key_end)
+        if torrent_bytes[index:key_end] == b'4:info':
+            return key_end, value_end
+        index = value_end
+    raise KeyError(b'info')
+
+def is_padding_file(raw_file_path):
+    """Check if an undecoded file path is a padding file (ex: `_____padding_file_0_if you see this file, ...`)."""
+    # Both markers contain "____padding", so most paths are ruled out with a single scan
+    return b"____padding" in raw_file_path and (b"_____padding" in raw_file_path or b".____padding" in raw_file_path)
 
 def get_torrent_details(torrent_path, add_files, add_files_limit, import_padding):
     try:
-        torrent_data = bencodepy.decode_from_file(torrent_path)
+        with open(torrent_path, 'rb') as torrent_file:
+            torrent_bytes = torrent_file.read()
+        torrent_data = decode_torrent(torrent_bytes)
         info_dict = torrent_data[b'info']
-        info_encoded = bencodepy.encode(info_dict)
-        info_hash = hashlib.sha1(info_encoded).digest()
+        # The info dictionary is hashed as it is stored in the file, instead of encoding the decoded dictionary again
+        info_start, info_end = get_info_span(torrent_bytes)
+        info_hash = hashlib.sha1(memoryview(torrent_bytes)[info_start:info_end]).digest()
         try:
             creation_date = datetime.utcfromtimestamp(torrent_data[b'creation date']).strftime('%Y-%m-%dT%H:%M:%S.000Z')
         except:
-            creation_date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        file_status = "single" if b'length' in info_dict else "multi"
-        files_count = None
-        total_size = 0
-        files_info = []
-        name = decode_with_fallback(info_dict[b'name'])
-        if file_status == "multi":
-            files_count = len(info_dict[b'files'])
-            files_info = []
-            file_index = 0
-            total_size = sum(file[b'length'] for file in info_dict[b'files'])
-            for file in info_dict[b'files']:
-                file_path = os.path.join(*[decode_with_fallback(part) for part in file[b'path']])
-                file_size = file[b'length']
-
-                if import_padding or ("_____padding" not in file_path and ".____padding" not in file_path) and file_index < add_files_limit:
-                    files_info.append((file_index, file_path, file_size))
-                file_index += 1
-                if file_index >= add_files_limit:
-                    file_status = 'over_threshold'
-                    break
-        else:
+            # Filled in with the time of insertion by `insert_batch`
+            creation_date = None
+        # Clients that store names in another encoding add a UTF-8 copy of them in the `.utf-8` keys, it is used when present
+        name = decode_with_fallback(info_dict.get(b'name.utf-8') or info_dict[b'name'])
+        if b'length' in info_dict:
             total_size = info_dict[b'length']
-            if add_files:
-                files_info.append((0, name, total_size))
-        return (info_hash, name, total_size, False, creation_date, creation_date, file_status, files_count, files_info)
+            files_info = [(0, name, total_size)] if add_files else []
+            return TorrentDetails(info_hash, name, total_size, False, creation_date, creation_date, "single", None, files_info)
+        files = info_dict[b'files']
+        files_count = len(files)
+        total_size = sum(file[b'length'] for file in files)
+        file_status = 'over_threshold' if files_count > add_files_limit else 'multi'
+        files_info = []
+        # Only the files within the limit are looked at and padding files are detected on the raw bytes,
+        # so they are never decoded when they are skipped
+        for file_index, file in enumerate(files[:add_files_limit]):
+            # The path parts are joined as bytes, so each path is decoded once instead of once per part
+            raw_file_path = b'/'.join(file.get(b'path.utf-8') or file[b'path'])
+            if import_padding or not is_padding_file(raw_file_path):
+                files_info.append((file_index, decode_with_fallback(raw_file_path), file[b'length']))
+        return TorrentDetails(info_hash, name, total_size, False, creation_date, creation_date, file_status, files_count, files_info)
     except Exception as e:
-        if str(e) == "b'name'":
+        # A missing name is recognised from the KeyError itself instead of from its message
+        if isinstance(e, KeyError) and e.args == (b'name',):
             tqdm.write(f"\n[ERROR]|[DETAILS]: '{torrent_path}': torrent 'name' is empty.")
         else:
             tqdm.write(f"\n[ERROR]|[DETAILS]: Unknown error '{torrent_path}': {e}")
         return None
 
-def insert_torrent_files(conn, info_hash, files_info, torrent_path):
-    sql_command = ("INSERT INTO torrent_files (info_hash, index, path, size, created_at, updated_at) "
-                   "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (info_hash, path) DO NOTHING")
-    cur = conn.cursor()
+def read_torrent_file(torrent_path, add_files, add_files_limit, import_padding):
+    """Returns the path of a .torrent file together with its details, runs in a worker process when `--jobs` is larger than 1."""
+    return torrent_path, get_torrent_details(torrent_path, add_files, add_files_limit, import_padding)
+
+def read_torrent_files(torrent_paths, add_files, add_files_limit, import_padding):
+    """Reads a chunk of .torrent files, runs in a worker process when `--jobs` is larger than 1."""
+    return [read_torrent_file(torrent_path, add_files, add_files_limit, import_padding) for torrent_path in torrent_paths]
+
+def read_torrent_files_in_pool(pool, torrent_paths, jobs, add_files, add_files_limit, import_padding):
+    """Reads chunks of .torrent files in the worker pool, yielding the results in order with a limited number of chunks in flight."""
+    in_flight = collections.deque()
+    while True:
+        chunk = list(itertools.islice(torrent_paths, JOBS_CHUNK_SIZE))
+        if not chunk:
+            break
+        in_flight.append(pool.apply_async(read_torrent_files, (chunk, add_files, add_files_limit, import_padding)))
+        if len(in_flight) > jobs * 2:
+            yield from in_flight.popleft().get()
+    while in_flight:
+        yield from in_flight.popleft().get()
+
+def insert_torrent_files(cur, info_hash, files_info, torrent_path, now):
+    cur.execute("SAVEPOINT insert_row")
     try:
         for file_info in files_info:
-            cur.execute(sql.SQL(sql_command), (info_hash,) + file_info + (datetime.now(timezone.utc), datetime.now(timezone.utc)))
-        conn.commit()
+            cur.execute(EXECUTE_INSERT_TORRENT_FILE, (info_hash,) + file_info + (now, now))
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         if str(e) ==  'A string literal cannot contain NUL (0x00) characters.':
             tqdm.write(f"[ERROR]|[FILE]: '{torrent_path}': filelist contains empty or invalid names.")
         else:
             tqdm.write(f"[ERROR]|[FILE]: Unknown error {torrent_path}': {e}")
-    finally:
-        cur.close()
 
-def insert_torrent(conn, torrent_details, torrent_path):
-    sql_command = ("INSERT INTO torrents (info_hash, name, size, private, created_at, updated_at, files_status, files_count) "
-                   "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (info_hash) DO NOTHING")
-    cur = conn.cursor()
+def insert_torrent(cur, torrent_details, torrent_path):
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command), torrent_details)
-        conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT, torrent_details)
+        cur.execute("RELEASE SAVEPOINT insert_row")
         return True
     except Exception as e:
-        conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         if str(e) == "A string literal cannot contain NUL (0x00) characters.":
             tqdm.write(f"[ERROR]|[TORRENT]: '{torrent_path}': torrent 'name' is an invalid string.")
         else:
             tqdm.write(f"[ERROR]|[TORRENT]: Unknown error'{torrent_path}': {e}")
         return False
-    finally:
-        cur.close()
 
-def insert_torrent_source(conn, source, info_hash, creation_date):
-    sql_command = ("INSERT INTO torrents_torrent_sources (source, info_hash, published_at, created_at, updated_at) "
-                   "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (source, info_hash) DO NOTHING")
+def insert_torrent_source(cur, source, info_hash, creation_date):
     values = (source, info_hash, creation_date, creation_date, creation_date)
-    cur = conn.cursor()
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command), values)
-        conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT_SOURCE, values)
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         tqdm.write(f"Error inserting torrent source into the database: {e}")
         tqdm.write(f"Torrent source of the error: {info_hash.hex()}\n")
-    finally:
-        cur.close()
 
-def insert_torrent_content(conn, info_hash, creation_date):
-    info_hash_hex = info_hash.hex()
-    tsvector_placeholder = f"'{info_hash_hex}'"
-    
-    sql_command = ("INSERT INTO torrent_contents (info_hash, languages, created_at, updated_at, tsv) "
-                   "VALUES (%s, %s, %s, %s, to_tsvector({tsvector_placeholder})) ON CONFLICT DO NOTHING")
-    
-    values = (info_hash, '[]', creation_date, creation_date)
-    cur = conn.cursor()
+def insert_torrent_content(cur, info_hash, creation_date):
+    values = (info_hash, '[]', creation_date, creation_date, info_hash.hex())
+    cur.execute("SAVEPOINT insert_row")
     try:
-        cur.execute(sql.SQL(sql_command.format(tsvector_placeholder=tsvector_placeholder)), values)
-        conn.commit()
+        cur.execute(EXECUTE_INSERT_TORRENT_CONTENT, values)
+        cur.execute("RELEASE SAVEPOINT insert_row")
     except Exception as e:
-        conn.rollback()
+        cur.execute("ROLLBACK TO SAVEPOINT insert_row")
         tqdm.write(f"Error inserting torrent content into the database: {e}")
         tqdm.write(f"Torrent source of the error: {info_hash.hex()}\n")
-    finally:
-        cur.close()
 
+def insert_torrent_details(cur, source_name, add_files, torrent_content, torrent_path, torrent_details, now):
+    """Insert a single torrent and its related rows, every statement runs in its own savepoint so a failing row does not
+    abort the transaction. The caller commits."""
+    insert_torrent_succeeded = insert_torrent(cur, torrent_details[:-1], torrent_path)  # Exclude files_info from torrent_details
+    if not insert_torrent_succeeded:
+        return
+    # Only run insert_torrent_files if file_status is not 'single' and there are files to insert
+    if add_files and torrent_details.files_info and torrent_details.files_status != "single":
+        insert_torrent_files(cur, torrent_details.info_hash, torrent_details.files_info, torrent_path, now)
+    insert_torrent_source(cur, source_name, torrent_details.info_hash, torrent_details.created_at)
+    if torrent_content:
+        insert_torrent_content(cur, torrent_details.info_hash, torrent_details.created_at)
+
+def copy_text_value(value):
+    """Format a value for PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    if isinstance(value, str):
+        return value.translate(COPY_TEXT_ESCAPES)
+    return str(value)
+
+def copy_rows(cur, table_name, columns, rows):
+    """Stream rows into a table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join([copy_text_value(value) for value in row]))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+def prepare_statements(cur):
+    """Prepare the statements once per session, the staging tables have to exist before the merges can be prepared."""
+    for statement in PREPARE_STATEMENTS:
+        cur.execute(statement)
+    cur.connection.commit()
+
+def create_staging_tables(cur):
+    """Create the session-local staging tables used to COPY batches before merging them into the bitmagnet tables."""
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrents_staging (LIKE torrents INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrent_files_staging "
+                "(info_hash bytea, index bigint, path text, size bigint, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrents_torrent_sources_staging "
+                "(source text, info_hash bytea, published_at timestamptz, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS torrent_contents_staging "
+                "(info_hash bytea, languages jsonb, created_at timestamptz, updated_at timestamptz) ON COMMIT DELETE ROWS")
+    cur.connection.commit()
+
+def insert_batch(cur, source_name, add_files, torrent_content, batch):
+    """Insert a batch of torrents and their related rows with one statement per table and a single commit.
+    If the batch fails, the torrents are inserted one by one to find and report the problematic ones."""
+    if not batch:
+        return
+    # The time is taken once per batch and shared by all its rows
+    now = datetime.now(timezone.utc)
+    now_iso = now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    batch = [(torrent_path, torrent_details if torrent_details.created_at else torrent_details._replace(created_at=now_iso, updated_at=now_iso))
+             for torrent_path, torrent_details in batch]
+    torrents = []
+    files = []
+    sources = []
+    contents = []
+    for torrent_path, torrent_details in batch:
+        info_hash = torrent_details.info_hash
+        creation_date = torrent_details.created_at
+        torrents.append(torrent_details[:-1])
+        if add_files and torrent_details.files_info and torrent_details.files_status != "single":
+            files.extend((info_hash,) + file_info + (now, now) for file_info in torrent_details.files_info)
+        sources.append((source_name, info_hash, creation_date, creation_date, creation_date))
+        if torrent_content:
+            contents.append((info_hash, '[]', creation_date, creation_date))
+
+    try:
+        # COPY has no ON CONFLICT, so the rows are copied into the staging tables and merged from there
+        copy_rows(cur, "torrents_staging", TORRENT_COLUMNS, torrents)
+        cur.execute(EXECUTE_MERGE_TORRENTS)
+        if files:
+            copy_rows(cur, "torrent_files_staging", TORRENT_FILE_COLUMNS, files)
+            cur.execute(EXECUTE_MERGE_TORRENT_FILES)
+        copy_rows(cur, "torrents_torrent_sources_staging", TORRENT_SOURCE_COLUMNS, sources)
+        cur.execute(EXECUTE_MERGE_TORRENT_SOURCES)
+        if contents:
+            copy_rows(cur, "torrent_contents_staging", TORRENT_CONTENT_COLUMNS, contents)
+            cur.execute(EXECUTE_MERGE_TORRENT_CONTENTS)
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        tqdm.write(f"[ERROR]|[BATCH]: Inserting a batch of {len(batch)} torrents failed, retrying them one by one: {e}")
+        for torrent_path, torrent_details in batch:
+            insert_torrent_details(cur, source_name, add_files, torrent_content, torrent_path, torrent_details, now)
+        cur.connection.commit()
 
 def check_source_exists(conn, source_key):
     """Check if a source key already exists in the database."""
     cur = conn.cursor()
     try:
-        cur.execute(sql.SQL("SELECT 1 FROM torrent_sources WHERE key = %s"), (source_key,))
+        cur.execute(SELECT_SOURCE_SQL, (source_key,))
         return cur.fetchone() is not None
     finally:
         cur.close()
@@ -182,8 +421,7 @@ def insert_source(conn, source_name):
     
     cur = conn.cursor()
     try:
-        cur.execute(sql.SQL("INSERT INTO torrent_sources (key, name, created_at, updated_at) VALUES (%s, %s, %s, %s)"),
-                    (source_key, source_name, timestamp_now, timestamp_now))
+        cur.execute(INSERT_SOURCE_SQL, (source_key, source_name, timestamp_now, timestamp_now))
         conn.commit()
         tqdm.write(f"[INFO]|[SOURCE]: '{source_name}' successfully added.")
     except Exception as e:
@@ -195,42 +433,68 @@ def insert_source(conn, source_name):
         cur.close()
 
 
-def process_torrent_files(directory_path, recursive, conn, source_name, add_files, add_files_limit, negative_to_zero, force_import_negative, import_padding, torrent_content):
-    torrent_paths = list(find_torrent_files(directory_path, recursive))
-    with tqdm(total=len(torrent_paths), desc="Processing Torrent Files") as pbar:
-        for torrent_path in torrent_paths:
-            try:
-                torrent_details = get_torrent_details(torrent_path, add_files, add_files_limit, import_padding)
+def process_torrent_files(directory_path, recursive, conn, source_name, add_files, add_files_limit, negative_to_zero, force_import_negative, import_padding, torrent_content, pool, jobs, walk_jobs, batch_size=1000):
+    # The paths are streamed from the directory walk, so reading starts right away and only the chunks being read are held in memory
+    torrent_paths = find_torrent_files(directory_path, recursive, walk_jobs)
+    # A single cursor is used for the whole import, transactions are committed once per batch
+    cur = conn.cursor()
+    try:
+        # The import can be re-run after a crash, so not waiting for the WAL flush on every commit is an acceptable trade-off
+        cur.execute("SET synchronous_commit = off")
+        create_staging_tables(cur)
+        prepare_statements(cur)
+        # The .torrent files are read in order, by worker processes if requested, and inserted sequentially here
+        if pool:
+            torrents_details = read_torrent_files_in_pool(pool, torrent_paths, jobs, add_files, add_files_limit, import_padding)
+        else:
+            torrents_details = (read_torrent_file(torrent_path, add_files, add_files_limit, import_padding) for torrent_path in torrent_paths)
+
+        with tqdm(desc="Processing Torrent Files", unit=" torrents") as pbar:
+            batch = []
+            # The progress bar is updated once per batch instead of once per file, skipped files are counted as well
+            processed = 0
+            # Info hashes read so far, copies of the same torrent in other directories are skipped before they reach PostgreSQL
+            seen_hashes = set()
+            for torrent_path, torrent_details in torrents_details:
+                processed += 1
                 if None == torrent_details:
                     continue
-                if not force_import_negative and (torrent_details[:-1][2] < 0): # If the torrent size is negative
+                if torrent_details.info_hash in seen_hashes:
+                    continue
+                seen_hashes.add(torrent_details.info_hash)
+                if not force_import_negative and (torrent_details.size < 0): # If the torrent size is negative
                     if negative_to_zero:
-                        tqdm.write(f"[INFO]|[SIZE]: '{torrent_path}' 'size' value is '{torrent_details[:-1][2]}', setting it to '0'.")
-                        torrent_details = torrent_details[:2] + (0,) + torrent_details[3:]
+                        tqdm.write(f"[INFO]|[SIZE]: '{torrent_path}' 'size' value is '{torrent_details.size}', setting it to '0'.")
+                        torrent_details = torrent_details._replace(size=0)
                     else:
-                        tqdm.write(f"[ERROR]|[SIZE]: '{torrent_path}' 'size' value is '{torrent_details[:-1][2]}', not importing.")
+                        tqdm.write(f"[ERROR]|[SIZE]: '{torrent_path}' 'size' value is '{torrent_details.size}', not importing.")
                         continue
                 else:
-                    if force_import_negative and (torrent_details[:-1][2] < 0):
-                        tqdm.write(f"[INFO]|[SIZE]: {torrent_path}' 'size' value is '{torrent_details[:-1][2]}', force importing.")
+                    if force_import_negative and (torrent_details.size < 0):
+                        tqdm.write(f"[INFO]|[SIZE]: {torrent_path}' 'size' value is '{torrent_details.size}', force importing.")
                 if torrent_details:
-                    insert_torrent_succeeded = insert_torrent(conn, torrent_details[:-1], torrent_path)  # Exclude files_info from torrent_details
-                    if not insert_torrent_succeeded:
-                        continue
-                    # Only run insert_torrent_files if file_status is not 'single' and there are files to insert
-                    if add_files and torrent_details[-1] and torrent_details[6] != "single":
-                        insert_torrent_files(conn, torrent_details[0], torrent_details[-1], torrent_path)
-                    insert_torrent_source(conn, source_name, torrent_details[0], torrent_details[4])
-                    if torrent_content:
-                        insert_torrent_content(conn, torrent_details[0], torrent_details[4])
-            finally:
-                pbar.update(1)
+                    batch.append((torrent_path, torrent_details))
+                if len(batch) >= batch_size:
+                    insert_batch(cur, source_name, add_files, torrent_content, batch)
+                    batch = []
+                    pbar.update(processed)
+                    processed = 0
+            insert_batch(cur, source_name, add_files, torrent_content, batch)
+            pbar.update(processed)
+    finally:
+        cur.close()
 
 def main():
     args = parse_arguments()
     if len(args.source_name) == 0:
         tqdm.write(f"[ERROR]|[ARGS]: --source is set to an empty string.")
         exit(1)
+    if args.jobs <= 0:
+        tqdm.write(f"[ERROR]|[ARGS]: --jobs must be a positive integer. '{args.jobs}' is invalid.")
+        exit(1)
+    if args.walk_jobs <= 0:
+        tqdm.write(f"[ERROR]|[ARGS]: --walk-jobs must be a positive integer. '{args.walk_jobs}' is invalid.")
+        exit(1)
     if args.negative_to_zero and args.force_import_negative:
         tqdm.write(f"[ERROR]|[ARGS]: --negative-to-zero and --force-import-negative may not be used together.")
         exit(1)
@@ -253,13 +517,19 @@ def main():
         "host": args.host,
         "port": args.port
     }
-    conn = psycopg2.connect(**db_params)
-    insert_source(conn, args.source_name)
-    source_key = args.source_name.lower()
-    process_torrent_files(args.directory_path, args.recursive, conn, source_key, args.add_files, args.add_files_limit, args.negative_to_zero, args.force_import_negative, args.import_padding, args.insert_torrent_content)
-
-    if conn:
-        conn.close()
+    # The worker processes are started before connecting, so they do not inherit the PostgreSQL connection
+    pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        insert_source(conn, args.source_name)
+        source_key = args.source_name.lower()
+        process_torrent_files(args.directory_path, args.recursive, conn, source_key, args.add_files, args.add_files_limit, args.negative_to_zero, args.force_import_negative, args.import_padding, args.insert_torrent_content, pool, args.jobs, args.walk_jobs)
+    finally:
+        if pool:
+            pool.terminate()
+        if conn:
+            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file